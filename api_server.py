@@ -0,0 +1,588 @@
+"""
+Local HTTP API for processing PF / ESIC / BANK statements without the Streamlit UI.
+
+Runs the same engine as the sections (statement_engine.StatementRun) as background
+jobs on a worker pool:
+
+  POST   /jobs                    create a job, returns {"id": ...} (202)
+  GET    /jobs                    list jobs
+  GET    /jobs/<id>               job status and progress
+  GET    /jobs/<id>/result        the ZIP of all units (streamed from disk)
+  GET    /jobs/<id>/units/<unit>  one unit's ZIP (read out of the result ZIP)
+  POST   /jobs/<id>/cancel        stop a queued or running job at the next page boundary;
+                                  with {"keep_partial": true} the PDFs already routed
+                                  still get their output (state "cancelled")
+  DELETE /jobs/<id>               drop the job and its files (cancelling it first)
+
+A job is created either from JSON naming files already on the server
+  {"type": "PF", "master": "C:/in/master.xlsx", "pdfs": ["C:/in/a.pdf", ...],
+   "mode": "highlight" | "mask", "pages": "all" | "relevant", "zip_name": "jan-2025.zip"}
+or from multipart/form-data with the fields type, mode, pages, zip_name, one "master"
+file and one or more "pdfs" files, streamed to the job directory as they arrive. Path
+inputs avoid copying the files at all. Finished jobs and their files are removed
+API_JOB_TTL seconds (default a day) after they finish.
+
+Start with `python api_server.py [--host 127.0.0.1] [--port 8600]`. If API_TOKEN is
+set, every request must send "Authorization: Bearer <token>".
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.message import Message
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+import ops_metrics
+from statement_engine import (
+    MODE_HIGHLIGHT, MODE_MASK, PAGES_ALL, PAGES_RELEVANT, RunCancelled, StatementRun, load_master, scan_warning,
+)
+from statement_profiles import PROFILES, get_profile
+from run_checkpoint import CHECKPOINTS_ENABLED, RunCheckpoint
+from output_pipeline import OutputPipeline
+from shared_master import PROCESS_WORKERS, route_in_processes
+
+API_TOKEN = os.environ.get("API_TOKEN")
+JOBS_DIR = os.environ.get("API_JOBS_DIR", os.path.join(tempfile.gettempdir(), "core_integra_jobs"))
+JOB_WORKERS = int(os.environ.get("API_JOB_WORKERS", "2"))
+PDF_WORKERS = int(os.environ.get("API_PDF_WORKERS", "4"))
+# Route a job's PDFs in worker processes over the memory-mapped master index
+# (shared_master.py); 0 routes them on threads instead.
+PDF_PROCESSES = int(os.environ.get("API_PDF_PROCESSES", str(PROCESS_WORKERS)))
+JOB_TTL = float(os.environ.get("API_JOB_TTL", str(24 * 3600)))  # seconds after a job finished
+_CHUNK_SIZE = 1024 * 1024
+_MAX_PART_HEADERS = 16 * 1024
+_MAX_FIELD_SIZE = 64 * 1024
+
+
+class JobError(ValueError):
+    """A job request that cannot be run; reported to the client as 400."""
+
+
+class Job:
+    def __init__(self, statement_type, master, pdfs, mode, page_mode, zip_name, directory):
+        self.id = os.path.basename(directory)
+        self.type = statement_type
+        self.master = master
+        self.pdfs = pdfs
+        self.mode = mode
+        self.page_mode = page_mode
+        self.zip_name = zip_name
+        self.directory = directory
+        self.state = "queued"
+        self.error = None
+        self.warnings = []
+        self.pdfs_done = 0
+        self.pages_done = 0
+        self.pages_total = 0
+        self.created = time.time()
+        self.finished = None
+        self.run = None
+        self.result_path = None
+        # Published by the worker thread (publish()): handler threads never read the run.
+        # Unit ZIPs are served from the result ZIP: {unit: its member name}.
+        self.units = {}
+        self.highlight = 0
+        self.mask = 0
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.keep_partial = False
+        self.deleted = False
+
+    def status(self):
+        with self.lock:
+            return {
+                "id": self.id,
+                "type": self.type,
+                "state": self.state,
+                "error": self.error,
+                "warnings": list(self.warnings),
+                "pdfs": {"done": self.pdfs_done, "total": len(self.pdfs)},
+                "pages": {"done": self.pages_done, "total": self.pages_total},
+                "units": list(self.units),
+                "highlight": self.highlight,
+                "mask": self.mask,
+                "created": self.created,
+                "finished": self.finished,
+            }
+
+    def publish(self, run):
+        """Copies the run's counts (and, once there is output, its units); worker thread only."""
+        units = {}
+        if self.result_path is not None:
+            with zipfile.ZipFile(self.result_path) as archive:
+                written = set(archive.namelist())
+            units = {unit: run.unit_zip_name(unit) for unit in run.output_units() if run.unit_zip_name(unit) in written}
+        with self.lock:
+            self.highlight = run.highlight
+            self.mask = run.mask
+            self.units = units
+
+    def set_state(self, state, error=None):
+        with self.lock:
+            self.state = state
+            if error is not None:
+                self.error = error
+            if state not in ("queued", "running"):
+                self.finished = time.time()
+
+    def on_page(self, page_number, total_pages):
+        with self.lock:
+            if page_number == 0:
+                self.pages_total += total_pages
+            self.pages_done += 1
+
+
+def _run_job(job):
+    """Worker: routes every PDF of the job, then writes the ZIP of all units to disk."""
+    ops_metrics.QUEUED_RUNS.dec(section=job.type)
+    running = not job.cancelled.is_set()
+    job.set_state("running" if running else "cancelled")
+    if running:
+        with ops_metrics.busy("api_job", JOB_WORKERS), ops_metrics.track_run(
+            job.type, lambda: job.run.page_count if job.run is not None else 0
+        ):
+            _route_job(job)
+    with job.lock:
+        if job.deleted:
+            _remove_job_files(job)
+
+
+def _remove_job_files(job):
+    if job.run is not None:
+        job.run.close()
+    shutil.rmtree(job.directory, ignore_errors=True)
+
+
+def _route_job(job):
+    try:
+        master = load_master(job.master, get_profile(job.type))
+        checkpoint = RunCheckpoint(master, job.mode, job.page_mode) if CHECKPOINTS_ENABLED else None
+        run = StatementRun(master, job.mode, checkpoint)
+        # Cancel requests reach route_pdf in the worker threads through the run's event.
+        run.cancelled = job.cancelled
+        job.run = run
+        # The job writes every unit: render unit PDFs while the next PDFs are routed.
+        OutputPipeline(run, render_early=True)
+        sources = [run.add_upload(path) for path in job.pdfs]
+
+        def record(source, result):
+            warning = scan_warning(os.path.basename(job.pdfs[source]), result)
+            with job.lock:
+                if warning:
+                    job.warnings.append(warning)
+                job.pdfs_done += 1
+            job.publish(run)
+
+        if PDF_PROCESSES > 1 and len(sources) > 1:
+            def on_result(source, result):
+                with job.lock:
+                    job.pages_total += result["page_count"]
+                    job.pages_done += result["page_count"]
+                record(source, result)
+
+            route_in_processes(run, sources, job.page_mode, on_result=on_result, max_workers=PDF_PROCESSES)
+        else:
+            with ThreadPoolExecutor(max_workers=PDF_WORKERS) as executor:
+                futures = {executor.submit(run.route, source, job.page_mode, job.on_page): source for source in sources}
+                for future in as_completed(futures):
+                    source = futures[future]
+                    result = future.result()
+                    run.add_result(source, result)
+                    record(source, result)
+
+        if run.output_units():
+            result_path = os.path.join(job.directory, job.zip_name)
+            run.write_master_zip(result_path)
+            job.result_path = result_path
+            job.publish(run)
+        state, error = "done", None
+    except RunCancelled:
+        # Cancelled while writing, the ZIP holds the units written so far; cancelled
+        # while routing, the partial output is built from the PDFs already routed.
+        result_path = os.path.join(job.directory, job.zip_name)
+        if job.keep_partial and not job.deleted and not os.path.exists(result_path) and job.run.output_units():
+            job.run.write_master_zip(result_path, cancellable=False)
+        if os.path.exists(result_path):
+            with zipfile.ZipFile(result_path) as archive:
+                keep = job.keep_partial and not job.deleted and archive.namelist()
+            if keep:
+                job.result_path = result_path
+                job.publish(job.run)
+            else:
+                os.remove(result_path)
+        state, error = "cancelled", None
+    except Exception as e:
+        state, error = "failed", str(e)
+    finally:
+        if job.run is not None:
+            job.run.close()  # unit ZIPs are served from the result ZIP
+    job.set_state(state, error)
+
+
+class JobManager:
+    def __init__(self, root=JOBS_DIR, workers=JOB_WORKERS):
+        self.root = root
+        self.jobs = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="statement-job")
+        os.makedirs(root, exist_ok=True)
+
+    def new_directory(self):
+        directory = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(os.path.join(directory, "inputs"))
+        return directory
+
+    def submit(self, directory, fields, master, pdfs):
+        self.expire()
+        statement_type = str(fields.get("type", "")).upper()
+        if statement_type not in PROFILES:
+            raise JobError(f"'type' must be one of {', '.join(PROFILES)}.")
+        mode = fields.get("mode", MODE_HIGHLIGHT)
+        if mode not in (MODE_HIGHLIGHT, MODE_MASK):
+            raise JobError(f"'mode' must be '{MODE_HIGHLIGHT}' or '{MODE_MASK}'.")
+        page_mode = fields.get("pages", PAGES_ALL)
+        if page_mode not in (PAGES_ALL, PAGES_RELEVANT):
+            raise JobError(f"'pages' must be '{PAGES_ALL}' or '{PAGES_RELEVANT}'.")
+        if not master or not pdfs:
+            raise JobError("A master Excel file and at least one PDF are required.")
+        for path in [master] + pdfs:
+            if not os.path.isfile(path):
+                raise JobError(f"File not found: {path}")
+        zip_name = fields.get("zip_name") or "output.zip"
+        if not isinstance(zip_name, str):
+            raise JobError("'zip_name' must be a file name.")
+        zip_name = os.path.basename(zip_name)
+
+        job = Job(statement_type, master, pdfs, mode, page_mode, zip_name, directory)
+        self.jobs[job.id] = job
+        ops_metrics.QUEUED_RUNS.inc(section=statement_type)
+        self.executor.submit(_run_job, job)
+        return job
+
+    def cancel(self, job_id, keep_partial=False):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.keep_partial = keep_partial
+        job.cancelled.set()
+        return job
+
+    def expire(self, ttl=JOB_TTL):
+        """Deletes the jobs (and their files) that finished more than `ttl` seconds ago."""
+        cutoff = time.time() - ttl
+        for job_id, job in list(self.jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                self.delete(job_id)
+
+    def delete(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        job.cancelled.set()
+        with job.lock:
+            if job.state in ("queued", "running"):
+                job.deleted = True  # the worker removes the files once it has stopped
+            else:
+                _remove_job_files(job)
+        return True
+
+
+def _json_object(body):
+    """The JSON object of a request body (empty: {}); JobError for anything else."""
+    try:
+        fields = json.loads(body or b"{}")
+    except ValueError:
+        raise JobError("Expected a JSON or multipart/form-data body.")
+    if not isinstance(fields, dict):
+        raise JobError("Expected a JSON object.")
+    return fields
+
+
+class _MultipartStream:
+    """Reads a multipart body of known length chunk by chunk, up to each boundary."""
+
+    def __init__(self, stream, length, boundary):
+        self.stream = stream
+        self.remaining = length
+        self.delimiter = b"\r\n--" + boundary.encode()
+        self.buffer = b"\r\n"  # the first delimiter has no CRLF before it
+
+    def _fill(self):
+        if self.remaining <= 0:
+            raise JobError("Truncated multipart/form-data body.")
+        chunk = self.stream.read(min(_CHUNK_SIZE, self.remaining))
+        if not chunk:
+            raise JobError("Truncated multipart/form-data body.")
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+
+    def read_until(self, marker, write, limit=None):
+        """Passes everything up to `marker` to write() and drops the marker itself."""
+        written = 0
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                data, self.buffer = self.buffer[:index], self.buffer[index + len(marker):]
+            else:
+                keep = len(marker) - 1
+                data, self.buffer = self.buffer[:-keep or None], self.buffer[-keep:]
+            written += len(data)
+            if limit is not None and written > limit:
+                raise JobError("A multipart/form-data part is too large.")
+            if data:
+                write(data)
+            if index >= 0:
+                return
+            self._fill()
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _input_path(directory, name):
+    inputs = os.path.join(directory, "inputs")
+    return os.path.join(inputs, f"{len(os.listdir(inputs)):04d}_{os.path.basename(name or 'upload')}")
+
+
+def parse_multipart(content_type, stream, length, directory):
+    """
+    Returns (fields, master path, [pdf paths]) of a multipart/form-data body read from
+    `stream`; file parts are written to the job directory as they arrive.
+    """
+    header = Message()
+    header["Content-Type"] = content_type
+    boundary = header.get_param("boundary")
+    if not boundary:
+        raise JobError("Expected a multipart/form-data body.")
+    body = _MultipartStream(stream, length, boundary)
+    body.read_until(body.delimiter, lambda data: None)  # preamble
+    fields, master, pdfs = {}, None, []
+    while body.read(2) != b"--":
+        raw = []
+        body.read_until(b"\r\n\r\n", raw.append, _MAX_PART_HEADERS)
+        part = BytesParser(policy=default_policy).parsebytes(b"".join(raw) + b"\r\n\r\n")
+        name = part.get_param("name", header="content-disposition")
+        if part.get_filename() is not None and name in ("master", "pdfs"):
+            path = _input_path(directory, part.get_filename())
+            with open(path, "wb") as f:
+                body.read_until(body.delimiter, f.write)
+            if name == "master":
+                master = path
+            else:
+                pdfs.append(path)
+        elif part.get_filename() is None and name:
+            value = []
+            body.read_until(body.delimiter, value.append, _MAX_FIELD_SIZE)
+            fields[name] = b"".join(value).decode(part.get_content_charset() or "utf-8").strip()
+        else:
+            body.read_until(body.delimiter, lambda data: None)
+    return fields, master, pdfs
+
+
+def _content_disposition(file_name):
+    """
+    An attachment header for a user-supplied name: a plain ASCII fallback (quotes, CR/LF
+    and other characters replaced, as for file names) plus the exact name per RFC 5987.
+    """
+    fallback = "".join(c if c.isascii() and (c.isalnum() or c in " ._-") else "_" for c in file_name)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name, safe='')}"
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "CoreIntegraAPI/1.0"
+    manager = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {"error": message})
+
+    def _send_stream(self, f, size, file_name):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Disposition", _content_disposition(file_name))
+        self.end_headers()
+        shutil.copyfileobj(f, self.wfile, _CHUNK_SIZE)
+
+    def _send_file(self, path, file_name):
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:  # deleted or expired meanwhile
+            self._send_error(HTTPStatus.NOT_FOUND, "The job's output was deleted.")
+            return
+        with f:
+            self._send_stream(f, os.fstat(f.fileno()).st_size, file_name)
+
+    def _send_member(self, path, member):
+        """One unit ZIP, streamed out of the job's result ZIP."""
+        try:
+            archive = zipfile.ZipFile(path)
+        except FileNotFoundError:
+            self._send_error(HTTPStatus.NOT_FOUND, "The job's output was deleted.")
+            return
+        with archive, archive.open(member) as f:
+            self._send_stream(f, archive.getinfo(member).file_size, member)
+
+    def _authorized(self):
+        if not API_TOKEN or self.headers.get("Authorization") == f"Bearer {API_TOKEN}":
+            return True
+        self._send_error(HTTPStatus.UNAUTHORIZED, "Missing or invalid API token.")
+        return False
+
+    def _job(self, job_id):
+        job = self.manager.jobs.get(job_id)
+        if job is None:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job: {job_id}")
+        return job
+
+    def _content_length(self):
+        """The request's Content-Length, or None (400 sent) if it is malformed."""
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+            return None
+        return length
+
+    def _path_parts(self):
+        return [unquote(part) for part in self.path.split("?", 1)[0].strip("/").split("/") if part]
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        if parts == ["jobs"]:
+            self._send_json(HTTPStatus.OK, [job.status() for job in list(self.manager.jobs.values())])
+            return
+        if len(parts) < 2 or parts[0] != "jobs":
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found.")
+            return
+        job = self._job(parts[1])
+        if job is None:
+            return
+        if len(parts) == 2:
+            self._send_json(HTTPStatus.OK, job.status())
+            return
+        with job.lock:
+            state, result_path, units = job.state, job.result_path, job.units
+        if state not in ("done", "cancelled"):
+            self._send_error(HTTPStatus.CONFLICT, f"Job is {state}.")
+            return
+        if state == "cancelled" and result_path is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "The job was cancelled without partial output.")
+            return
+        if parts[2:] == ["result"]:
+            if result_path is None:
+                self._send_error(HTTPStatus.NOT_FOUND, "No unit matched; there is no output.")
+            else:
+                self._send_file(result_path, job.zip_name)
+        elif len(parts) == 4 and parts[2] == "units":
+            unit = parts[3]
+            if unit not in units:
+                self._send_error(HTTPStatus.NOT_FOUND, f"No output for unit: {unit}")
+            else:
+                self._send_member(result_path, units[unit])
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found.")
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        length = self._content_length()
+        if length is None:
+            return
+        content_type = self.headers.get("Content-Type", "")
+        multipart = content_type.startswith("multipart/form-data")
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            try:
+                keep_partial = bool(_json_object(self.rfile.read(length)).get("keep_partial"))
+            except JobError as e:
+                self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+                return
+            job = self.manager.cancel(parts[1], keep_partial)
+            if job is None:
+                self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job: {parts[1]}")
+            else:
+                self._send_json(HTTPStatus.ACCEPTED, job.status())
+            return
+        if parts != ["jobs"]:
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found.")
+            return
+        directory = self.manager.new_directory()
+        try:
+            if multipart:
+                fields, master, pdfs = parse_multipart(content_type, self.rfile, length, directory)
+            else:
+                fields = _json_object(self.rfile.read(length))
+                master, pdfs = fields.get("master"), fields.get("pdfs") or []
+                if not isinstance(master, (str, type(None))):
+                    raise JobError("'master' must be a path.")
+                if not isinstance(pdfs, list) or not all(isinstance(path, str) for path in pdfs):
+                    raise JobError("'pdfs' must be a list of paths.")
+            job = self.manager.submit(directory, fields, master, pdfs)
+        except JobError as e:
+            shutil.rmtree(directory, ignore_errors=True)
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        except Exception as e:
+            shutil.rmtree(directory, ignore_errors=True)
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            raise
+        self._send_json(HTTPStatus.ACCEPTED, {"id": job.id, "status": f"/jobs/{job.id}"})
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "jobs" and self.manager.delete(parts[1]):
+            self._send_json(HTTPStatus.OK, {"deleted": parts[1]})
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, "Not found.")
+
+
+def make_server(host="127.0.0.1", port=8600, manager=None):
+    handler = type("BoundApiHandler", (ApiHandler,), {"manager": manager or JobManager()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Core Integra statement processing API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+
+    ops_metrics.start_exporters()
+    server = make_server(args.host, args.port)
+    print(f"Serving statement API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,10 @@ def run_archival_section():
     st.subheader("🗄️ Archival Dashboard")
     uploaded_file = st.file_uploader("Upload Archival File", type=["pdf", "xlsx"])
     if uploaded_file:
+        counted = st.session_state.setdefault("archival_counted_uploads", set())
+        if uploaded_file.file_id not in counted:
+            import ops_metrics
+
+            ops_metrics.INPUT_BYTES.inc(uploaded_file.size, section="ARCHIVAL")
+            counted.add(uploaded_file.file_id)
         st.success(f"Uploaded: {uploaded_file.name}")
@@ -0,0 +1,88 @@
+"""
+Text extraction benchmark: default full-page `get_text("words")` against each statement
+type's extraction profile (statement_profiles.py, "extraction": band and flags).
+
+For every PDF it reports the median extraction time per page before and after, the
+number of words returned and how many ID-pattern tokens fell outside the band (these
+should be page numbers and other footer text, never IDs).
+
+Usage:
+    python benchmarks/extraction_profiles.py PF=pf.pdf ESIC=esic.pdf BANK=bank.pdf [--repeat 5] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_pages(doc, extract, repeat):
+    """Median seconds per page of `extract(page)` over `repeat` passes, and the words of the last."""
+    samples = []
+    words = []
+    for _ in range(repeat):
+        words = []
+        start = time.perf_counter()
+        for page in doc:
+            words.append(extract(page))
+        samples.append((time.perf_counter() - start) / max(len(doc), 1))
+    return statistics.median(samples), words
+
+
+def candidate_count(words, profile):
+    return sum(1 for page_words in words for w in page_words if profile.id_regex.fullmatch(w[4]))
+
+
+def bench(name, path, repeat):
+    import fitz  # PyMuPDF
+
+    from statement_engine import extract_words
+    from statement_profiles import get_profile
+
+    profile = get_profile(name)
+    with fitz.open(path) as doc:
+        before, full_words = time_pages(doc, lambda page: page.get_text("words"), repeat)
+        after, profile_words = time_pages(doc, lambda page: extract_words(page, profile), repeat)
+        pages = len(doc)
+    return {
+        "type": name,
+        "pdf": os.path.basename(path),
+        "pages": pages,
+        "before_ms_per_page": round(before * 1000, 3),
+        "after_ms_per_page": round(after * 1000, 3),
+        "speedup": round(before / after, 2) if after else None,
+        "words_before": sum(map(len, full_words)),
+        "words_after": sum(map(len, profile_words)),
+        "candidates_dropped": candidate_count(full_words, profile) - candidate_count(profile_words, profile),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+", metavar="TYPE=PDF", help="statement type (PF, ESIC, BANK) and PDF path")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    results = []
+    for item in args.pdfs:
+        name, _, path = item.partition("=")
+        results.append(bench(name.upper(), path, args.repeat))
+
+    columns = ("type", "pdf", "pages", "before_ms_per_page", "after_ms_per_page", "speedup",
+               "words_before", "words_after", "candidates_dropped")
+    print("  ".join(columns))
+    for row in results:
+        print("  ".join(str(row[column]) for column in columns))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Load test: N concurrent PF / ESIC / BANK sessions against the engine, per session count.
+
+Each session does what a section does on "Generate" and "Prepare ZIP of all units":
+reads the master, routes its statements (StatementRun with the output pipeline), looks
+for duplicates and builds the ZIP of all units in memory. Sessions run as threads in
+one process, like Streamlit sessions sharing the server process, and every session
+count runs in a fresh interpreter so its memory figures are not inflated by the
+previous level.
+
+Synthetic statements and a matching master are generated on first use (--data).
+
+For each session count it reports end-to-end session latency (median / p95 / max),
+throughput in pages per second across all sessions, and the peak RSS of the process
+the sessions share (the output pipeline's worker processes are not included).
+With --baseline, levels whose p95 latency or peak RSS grew by more than --tolerance
+against an earlier --json result are reported and the exit status is 1.
+
+Usage:
+    python benchmarks/load_test.py [--sessions 1,2,4,8] [--types PF,ESIC,BANK] [--pdfs 2]
+                                   [--pages 20] [--units 20] [--json results.json]
+                                   [--baseline previous.json] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ID_LENGTHS = {"PF": 12, "ESIC": 10, "BANK": 11}
+ROWS_PER_PAGE = 30
+
+
+def make_data(directory, units, pdfs, pages, seed=7):
+    """A master with every statement type's ID column, and `pdfs` statements of each type."""
+    import random
+
+    import fitz  # PyMuPDF
+    import pandas as pd
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    unit_names = [f"UNIT {i:03d}" for i in range(units)]
+    rows = units * 25
+    ids = {
+        name: [str(rng.randrange(10 ** (length - 1), 10 ** length)) for _ in range(rows)]
+        for name, length in ID_LENGTHS.items()
+    }
+    master = {"UNIT": [unit_names[i % units] for i in range(rows)]}
+    master.update({"UAN": ids["PF"], "ESINO": ids["ESIC"], "BANK_ACC_NO": ids["BANK"]})
+    pd.DataFrame(master).to_excel(os.path.join(directory, "master.xlsx"), index=False)
+
+    for name, type_ids in ids.items():
+        for number in range(pdfs):
+            doc = fitz.open()
+            for _ in range(pages):
+                page = doc.new_page()
+                page.insert_text((50, 40), f"{name} statement for the month of Jan 2025  {rng.choice(unit_names)}")
+                for row in range(ROWS_PER_PAGE):
+                    page.insert_text(
+                        (40, 80 + row * 24),
+                        f"{row + 1} {rng.choice(type_ids)} EMPLOYEE NAME {row} 15000.00 1800.00",
+                    )
+            doc.save(os.path.join(directory, f"{name.lower()}_{number}.pdf"))
+            doc.close()
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_s": round(statistics.median(samples), 3),
+        "p95_s": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max_s": round(samples[-1], 3),
+    }
+
+
+def session(data, statement_type):
+    """One section run end to end; returns (seconds, pages)."""
+    from output_pipeline import OutputPipeline
+    from statement_engine import MODE_HIGHLIGHT, PAGES_ALL, StatementRun, load_master
+    from statement_profiles import get_profile
+
+    start = time.perf_counter()
+    master = load_master(os.path.join(data, "master.xlsx"), get_profile(statement_type))
+    run = StatementRun(master, MODE_HIGHLIGHT)
+    OutputPipeline(run)
+    try:
+        prefix = f"{statement_type.lower()}_"
+        for entry in sorted(os.listdir(data)):
+            if entry.startswith(prefix) and entry.endswith(".pdf"):
+                run.process(os.path.join(data, entry), PAGES_ALL)
+        run.find_duplicates()
+        run.pipeline.start_units(run.output_units())
+        run.master_zip()
+        return time.perf_counter() - start, run.page_count
+    finally:
+        run.close()
+
+
+def run_level(data, sessions, types):
+    """Runs `sessions` concurrent sessions (cycling through `types`) in this process."""
+    from ops_metrics import peak_rss_bytes
+
+    results = [None] * sessions
+    errors = []
+
+    def worker(index):
+        try:
+            results[index] = session(data, types[index % len(types)])
+        except Exception as e:  # reported, the level still finishes
+            errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    done = [r for r in results if r is not None]
+    rss = peak_rss_bytes()
+    return {
+        "sessions": sessions,
+        "failed": len(errors),
+        "errors": errors[:3],
+        "latency": summarize([seconds for seconds, _ in done]) if done else None,
+        "pages_per_second": round(sum(pages for _, pages in done) / elapsed, 2) if elapsed else None,
+        "wall_s": round(elapsed, 3),
+        "peak_rss_mb": round(rss / 2 ** 20, 1) if rss else None,
+    }
+
+
+def measure(data, sessions, types):
+    """run_level in a fresh interpreter."""
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--data", data, "--level", str(sessions), "--types", ",".join(types)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def regressions(results, baseline, tolerance):
+    previous = {level["sessions"]: level for level in baseline}
+    found = []
+    for level in results:
+        before = previous.get(level["sessions"])
+        if not before or not level["latency"] or not before["latency"]:
+            continue
+        checks = [("p95 latency", before["latency"]["p95_s"], level["latency"]["p95_s"])]
+        if before["peak_rss_mb"] and level["peak_rss_mb"]:
+            checks.append(("peak RSS", before["peak_rss_mb"], level["peak_rss_mb"]))
+        for label, old, new in checks:
+            if old and new > old * (1 + tolerance):
+                found.append(f"{level['sessions']} session(s): {label} {old} -> {new}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,2,4,8", help="comma-separated concurrent session counts")
+    parser.add_argument("--types", default="PF,ESIC,BANK", help="statement types the sessions cycle through")
+    parser.add_argument("--pdfs", type=int, default=2, help="statements per type and session")
+    parser.add_argument("--pages", type=int, default=20, help="pages per statement")
+    parser.add_argument("--units", type=int, default=20, help="units in the master")
+    parser.add_argument("--data", help="directory of the synthetic data (default: a temporary directory)")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--baseline", help="earlier --json results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth against the baseline")
+    parser.add_argument("--level", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    types = [name.strip().upper() for name in args.types.split(",") if name.strip()]
+
+    if args.level:
+        print(json.dumps(run_level(args.data, args.level, types)))
+        return
+
+    data = args.data or os.path.join(tempfile.gettempdir(), f"load_test_{args.units}u_{args.pdfs}x{args.pages}p")
+    if not os.path.exists(os.path.join(data, "master.xlsx")):
+        make_data(data, args.units, args.pdfs, args.pages)
+
+    results = [measure(data, int(n), types) for n in args.sessions.split(",")]
+
+    print(f"{'sessions':>8}  {'median s':>9}  {'p95 s':>9}  {'max s':>9}  {'pages/s':>9}  {'peak MB':>8}  {'failed':>6}")
+    for level in results:
+        latency = level["latency"] or {}
+        print(
+            f"{level['sessions']:>8}  {latency.get('median_s', '-'):>9}  {latency.get('p95_s', '-'):>9}  "
+            f"{latency.get('max_s', '-'):>9}  {level['pages_per_second']:>9}  {level['peak_rss_mb']:>8}  {level['failed']:>6}"
+        )
+        for error in level["errors"]:
+            print(f"          {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Startup and rerun latency benchmark for the Streamlit app (main.py).
+
+Drives the app headlessly with Streamlit's AppTest and reports:
+  - cold first render: a fresh interpreter importing the app and rendering the login page,
+  - login rerun, first open of each section, and repeat reruns of an open section
+    (the per-interaction cost a user pays on every widget change).
+
+Usage:
+    python benchmarks/startup_latency.py [--cold-runs 3] [--reruns 10] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "main.py")
+
+COLD_SCRIPT = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+print(time.perf_counter() - start)
+"""
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+        "max_ms": round(samples[-1] * 1000, 1),
+    }
+
+
+def time_run(at):
+    start = time.perf_counter()
+    at.run()
+    return time.perf_counter() - start
+
+
+def cold_first_render(runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", COLD_SCRIPT.format(app=APP)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return summarize(samples)
+
+
+def warm_session(reruns):
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    at = AppTest.from_file(APP, default_timeout=120)
+    results["first_render_in_process"] = summarize([time_run(at)])
+    results["login_rerun"] = summarize([time_run(at)])
+
+    at.text_input[0].input("admin")
+    at.text_input[1].input("password")
+    at.button[0].click()
+    results["login_submit"] = summarize([time_run(at)])
+
+    for label in ["PF", "ESIC", "BANK", "ARCHIVAL"]:
+        button = next(b for b in at.sidebar.button if b.label == label)
+        button.click()
+        results[f"open_{label.lower()}"] = summarize([time_run(at)])
+        results[f"rerun_{label.lower()}"] = summarize([time_run(at) for _ in range(reruns)])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    results = {"cold_first_render": cold_first_render(args.cold_runs)}
+    results.update(warm_session(args.reruns))
+
+    width = max(len(name) for name in results)
+    print(f"{'stage':<{width}}  {'median ms':>10}  {'p95 ms':>10}  {'runs':>5}")
+    for name, stats in results.items():
+        print(f"{name:<{width}}  {stats['median_ms']:>10}  {stats['p95_ms']:>10}  {stats['runs']:>5}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+def run_combined_section():
+    import streamlit as st
+    import time  # For timing and progress
+    from statement_profiles import get_profile
+    from statement_engine import load_masters, scan_warning, MODE_HIGHLIGHT, MODE_MASK, PAGES_ALL, PAGES_RELEVANT
+    from combined_run import CombinedRun, STATEMENT_TYPES
+    import ops_metrics
+    from results_view import remember_run, show_duplicates, show_out_of_period, show_resumed, show_run_downloads
+    from run_checkpoint import CHECKPOINTS_ENABLED, RunCheckpoint
+    from period_filter import period_from_ui
+
+    profiles = [get_profile(name) for name in STATEMENT_TYPES]
+
+    # ----------------------- Streamlit Layout -----------------------
+    st.title("All Statements (PF + ESIC + BANK)")
+
+    # Step 1: File Uploads (one column per statement type, plus the shared master)
+    col_pf, col_esic, col_bank, col_excel = st.columns(4)
+    with col_pf:
+        st.header("PF PDFs")
+        pf_files = st.file_uploader("Upload PF PDF files", type="pdf", accept_multiple_files=True)
+    with col_esic:
+        st.header("ESIC PDFs")
+        esic_files = st.file_uploader("Upload ESIC PDF files", type="pdf", accept_multiple_files=True)
+    with col_bank:
+        st.header("BANK PDFs")
+        bank_files = st.file_uploader("Upload BANK PDF files", type="pdf", accept_multiple_files=True)
+    with col_excel:
+        st.header("Master Excel")
+        excel_file = st.file_uploader(
+            "Excel file with UNIT, UAN, ESINO and BANK_ACC_NO columns",
+            type=["xlsx", "xls"]
+        )
+
+    # Step 2: Processing Options
+    st.header("Processing Options")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        mode = st.radio("Select Processing Mode", ["Highlight", "Mask All Not Relevant"], index=0)
+    with col2:
+        page_mode = st.radio("Select Page Inclusion Mode", ["Keep All Pages", "Relevant Pages Only"], index=0)
+    with col3:
+        month = st.selectbox("Select Month", ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])
+    with col4:
+        year = st.number_input("Select Year", min_value=2000, max_value=2100, step=1, value=2025)
+
+    skip_duplicates = st.checkbox("Skip duplicate pages in unit PDFs", value=False)
+    skip_other_months = st.checkbox("Skip pages dated outside the selected month", value=False)
+    resume = st.checkbox("Resume interrupted runs from checkpoints", value=CHECKPOINTS_ENABLED)
+
+    generate_button = st.button("Generate")
+
+    # Step 3: Processing & Download
+    st.header("Processing & Download")
+    if generate_button:
+        uploads = {"PF": pf_files or [], "ESIC": esic_files or [], "BANK": bank_files or []}
+        uploads = {name: files for name, files in uploads.items() if files}
+        if not (uploads and excel_file):
+            st.info("Please upload the master Excel file and the PDF(s) of at least one statement type.")
+            st.stop()
+
+        try:
+            # The master is read once and indexed for every statement type.
+            masters = load_masters(excel_file, [p for p in profiles if p.name in uploads])
+        except Exception as e:
+            st.error("❌ Error reading Excel file. Please check the file and column names.")
+            st.error(e)
+            st.stop()
+
+        engine_mode = MODE_HIGHLIGHT if mode == "Highlight" else MODE_MASK
+        engine_page_mode = PAGES_RELEVANT if page_mode == "Relevant Pages Only" else PAGES_ALL
+
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        total_files = sum(len(files) for files in uploads.values())
+        completed = [0]
+        start_time = time.time()
+
+        def on_done(name, pdf, result):
+            warning = scan_warning(pdf.name, result)
+            if warning:
+                st.warning(warning)
+            completed[0] += 1
+            progress_bar.progress(completed[0] / total_files)
+            status_text.text(f"🔄 Processed {completed[0]} of {total_files} PDFs ({name}: {pdf.name})")
+
+        # All statement types are routed on one shared worker pool.
+        period = period_from_ui(month, year) if skip_other_months else None
+        checkpoints = {
+            name: RunCheckpoint(master, engine_mode, engine_page_mode, period=period) for name, master in masters.items()
+        } if resume else None
+        run = CombinedRun(masters, engine_mode, checkpoints, period)
+        with ops_metrics.track_run("COMBINED", lambda: run.page_count):
+            run.process_all(uploads, engine_page_mode, on_done=on_done)
+        run.find_duplicates(suppress=skip_duplicates)
+        show_resumed(run)
+        show_duplicates(run)
+        show_out_of_period(run)
+
+        if not run.output_units():
+            st.error("Mismatch: PDF & Excel file data not matching. Please upload proper data.")
+            run.close()
+            remember_run("combined_run", None)
+        else:
+            remember_run("combined_run", run, f"{month}-{year}.zip")
+            elapsed_time = time.time() - start_time
+            st.success(
+                f"Processing complete in {elapsed_time:.2f} seconds. "
+                f"Highlight annotations: {run.highlight}, Mask annotations: {run.mask}."
+            )
+        progress_bar.empty()
+        status_text.text("✅ Processing complete.")
+
+    show_run_downloads("combined_run", "Download All Units in One ZIP")
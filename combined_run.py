@@ -0,0 +1,147 @@
+"""
+One run over the PF, ESIC and BANK statements of a period.
+
+The master Excel file is read once (statement_engine.load_masters) and the PDFs of all
+three statement types are routed on one shared worker pool, instead of three separate
+section runs. The output is one folder per unit holding all its statements:
+
+  <unit>/PF/<unit>_Processed.pdf, <unit>_Match.xlsx, <unit>_Unmatch.xlsx
+  <unit>/ESIC/<unit>_ESINO.pdf, ...
+  <unit>/BANK/<unit>_Bank.pdf, ...
+"""
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from statement_engine import StatementRun, unit_reports
+
+STATEMENT_TYPES = ("PF", "ESIC", "BANK")
+MAX_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+class CombinedRun:
+    """
+    A StatementRun per statement type, sharing one worker pool. Offers the same
+    download interface as StatementRun (see results_view.py), per unit across types.
+    """
+
+    def __init__(self, masters, mode, checkpoints=None, period=None):
+        checkpoints = checkpoints or {}
+        self.runs = {
+            name: StatementRun(master, mode, checkpoints.get(name), period) for name, master in masters.items()
+        }
+        self.units = []
+        for run in self.runs.values():
+            self.units.extend(unit for unit in run.master.units if unit not in self.units)
+        self._unit_files = {}
+        self._master_zip = None
+
+    @property
+    def highlight(self):
+        return sum(run.highlight for run in self.runs.values())
+
+    @property
+    def mask(self):
+        return sum(run.mask for run in self.runs.values())
+
+    @property
+    def page_count(self):
+        return sum(run.page_count for run in self.runs.values())
+
+    @property
+    def resumed(self):
+        return sum(run.resumed for run in self.runs.values())
+
+    def process_all(self, uploads, page_mode, on_done=None, max_workers=MAX_WORKERS):
+        """
+        Routes {statement type: [uploads]} on one thread pool. on_done(name, upload,
+        result) is called in the calling thread as each PDF finishes. If this is left by
+        an exception (e.g. Streamlit stopping the script), every run is cancelled so the
+        workers stop at their next page boundary.
+        """
+        jobs = []
+        for name, files in uploads.items():
+            run = self.runs[name]
+            jobs.extend((name, upload, run.add_upload(upload)) for upload in files)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.runs[name].route, source, page_mode): (name, upload, source)
+                for name, upload, source in jobs
+            }
+            try:
+                for future in as_completed(futures):
+                    name, upload, source = futures[future]
+                    result = future.result()
+                    self.runs[name].add_result(source, result)
+                    if on_done:
+                        on_done(name, upload, result)
+            except BaseException:
+                self.cancel()
+                raise
+        self._unit_files = {}
+        self._master_zip = None
+
+    def cancel(self):
+        for run in self.runs.values():
+            run.cancel()
+
+    def find_duplicates(self, suppress=False):
+        for run in self.runs.values():
+            run.find_duplicates(suppress=suppress)
+        self._unit_files = {}
+        self._master_zip = None
+
+    def duplicate_report(self):
+        return [f"{name}: {line}" for name, run in self.runs.items() for line in run.duplicate_report()]
+
+    def out_of_period_report(self):
+        return [f"{name}: {line}" for name, run in self.runs.items() for line in run.out_of_period_report()]
+
+    def output_units(self):
+        """Units with output for at least one statement type, in master order."""
+        with_output = set()
+        for run in self.runs.values():
+            with_output.update(run.output_units())
+        return [unit for unit in self.units if unit in with_output]
+
+    def unit_files(self, unit):
+        """[(path inside the unit folder, bytes)] of the unit's statements, rendered once."""
+        if unit not in self._unit_files:
+            files = []
+            for name, run in self.runs.items():
+                if unit not in run.output_units():
+                    continue
+                profile = run.master.profile
+                matched_bytes, unmatched_bytes = unit_reports(run.master, unit, run.matched[unit])
+                files.append((f"{name}/{profile.file_name('pdf', unit)}", run.render_unit_pdf(unit)))
+                files.append((f"{name}/{profile.file_name('matched', unit)}", matched_bytes))
+                files.append((f"{name}/{profile.file_name('unmatched', unit)}", unmatched_bytes))
+            self._unit_files[unit] = files
+        return self._unit_files[unit]
+
+    def unit_zip_name(self, unit):
+        return f"{unit}_All_Statements.zip"
+
+    def unit_zip(self, unit):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path, data in self.unit_files(unit):
+                archive.writestr(path, data)
+        return buffer.getvalue()
+
+    def master_zip(self):
+        """One tree for all units: <unit>/<statement type>/<files>."""
+        if self._master_zip is None:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for unit in self.output_units():
+                    for path, data in self.unit_files(unit):
+                        archive.writestr(f"{unit}/{path}", data)
+            self._master_zip = buffer.getvalue()
+        return self._master_zip
+
+    def close(self):
+        for run in self.runs.values():
+            run.close()
@@ -0,0 +1,238 @@
+"""
+Tolerant lookup of statement tokens against the master IDs (UAN / ESINO / BANK_ACC_NO).
+
+Statements do not always print an ID exactly as it is stored in the master:
+  - zero-padded numbers ("000123456789" for a master value of 123456789),
+  - grouped digits ("1234 5678 9012" or "1234-5678-9012"),
+  - masked numbers ("XXXXXX1234", "****1234").
+
+Master IDs are reduced to a canonical digit key (separators removed, leading zeros
+stripped) held in sorted fixed-width arrays, plus the sorted reversed keys so a masked
+token's visible suffix resolves with a binary search instead of comparing it against
+every master ID. A masked token only counts when its suffix belongs to exactly one
+master ID: "XXXXXXXX0002" says nothing about which of several IDs ending in 0002 was
+printed. A page's candidates are looked up together (lookup_many) with one
+vectorised search.
+
+The arrays take about a fifth of the memory of the equivalent dicts (11 MB instead of
+58 MB for 200,000 IDs), which counts with one master per Streamlit session, and they
+can be written to disk once and memory-mapped by worker processes instead of pickling
+the index into every task (shared_master.py).
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_SEPARATORS = re.compile(r"[\s\-]")
+_MASKED = re.compile(r"[Xx*#•]+(\d+)")
+_MASK_CHARS = re.compile(r"[Xx*#•]")
+
+# Digit groups longer than this are treated as complete numbers, not parts of a grouped ID.
+MAX_GROUP_DIGITS = 6
+
+# Resolved tokens kept per index; statements repeat IDs, but not without bound.
+LOOKUP_CACHE_SIZE = 100_000
+
+
+def normalize_id(value):
+    """
+    Cleans a master ID cell read with dtype=str: strips separators and a trailing ".0"
+    left by numeric cells, and keeps leading zeros. Empty cells become "".
+    """
+    if value is None or value != value:  # None or NaN
+        return ""
+    text = _SEPARATORS.sub("", str(value))
+    if text.endswith(".0") and text[:-2].isdigit():
+        text = text[:-2]
+    return text
+
+
+def _canonical(text):
+    return _SEPARATORS.sub("", text).lstrip("0")
+
+
+def is_candidate(token, id_regex):
+    """
+    True if the token looks like an ID of this statement type. Masked characters count
+    as digits, so "XXXXXXXX1234" is a 12-digit candidate.
+    """
+    return bool(id_regex.fullmatch(_MASK_CHARS.sub("0", _SEPARATORS.sub("", token))))
+
+
+class PackedIdIndex:
+    """
+    Index over {unit: [master IDs]} as flat NumPy arrays: the sorted canonical keys,
+    each key's (unit code, master ID) entries in CSR form, and the sorted reversed keys
+    pointing back at their key. lookup(token) returns {unit: (master IDs)} for every
+    unit the token resolves to. `save()` writes the arrays to a directory; `load()`
+    memory-maps them, so every worker process shares the same pages.
+    """
+
+    _ARRAYS = ("keys", "entry_start", "entry_unit", "entry_id", "rkeys", "rkey_pos")
+
+    def __init__(self, arrays, units, min_suffix=4):
+        self.units = list(units)
+        self.min_suffix = min_suffix
+        for name in self._ARRAYS:
+            setattr(self, name, arrays[name])
+        # LRU of resolved tokens; routing threads share the index.
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def from_ids(cls, unit_id_dict, min_suffix=4):
+        """Builds the index; unit codes follow the order of `unit_id_dict`."""
+        keys, entry_unit, entry_id = [], [], []
+        for code, ids in enumerate(unit_id_dict.values()):
+            # A unit listing an ID twice keeps it once; "0123" and "123" stay separate IDs.
+            for master_id in dict.fromkeys(ids):
+                key = _canonical(normalize_id(master_id))
+                if key.isascii() and key.isdigit():
+                    keys.append(key)
+                    entry_unit.append(code)
+                    entry_id.append(master_id)
+        keys = np.array(keys, dtype=bytes).reshape(-1)
+        entry_unit = np.array(entry_unit, dtype=np.int32)
+        # Stable, so a key's entries keep the master's order: first unit first.
+        order = np.argsort(keys, kind="stable")
+        keys, entry_unit = keys[order], entry_unit[order]
+        unique, entry_start = np.unique(keys, return_index=True)
+        reversed_keys = np.array([key[::-1] for key in unique.tolist()], dtype=bytes).reshape(-1)
+        rkey_pos = np.argsort(reversed_keys, kind="stable")
+        arrays = {
+            "keys": unique,
+            "entry_start": np.append(entry_start, len(keys)).astype(np.int64),
+            "entry_unit": entry_unit,
+            "entry_id": np.array([str(entry_id[i]).encode() for i in order], dtype=bytes).reshape(-1),
+            "rkeys": reversed_keys[rkey_pos],
+            "rkey_pos": rkey_pos.astype(np.int64),
+        }
+        return cls(arrays, unit_id_dict, min_suffix)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, units, min_suffix=4):
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in cls._ARRAYS}
+        return cls(arrays, units, min_suffix)
+
+    def _positions(self, keys):
+        """Position of each canonical key (bytes) in `keys`, or -1 where it is absent."""
+        keys = np.array(keys, dtype=bytes).reshape(-1)
+        if not len(self.keys) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, pos, -1)
+
+    def _entries(self, pos):
+        """{unit: (master IDs)} of the key at `pos`."""
+        hits = {}
+        for i in range(self.entry_start[pos], self.entry_start[pos + 1]):
+            hits.setdefault(self.units[self.entry_unit[i]], []).append(self.entry_id[i].decode())
+        return {unit: tuple(ids) for unit, ids in hits.items()}
+
+    def _cached(self, token):
+        with self._cache_lock:
+            hits = self._cache.get(token)
+            if hits is not None:
+                self._cache.move_to_end(token)
+            return hits
+
+    def _remember(self, token, hits):
+        with self._cache_lock:
+            self._cache[token] = hits
+            self._cache.move_to_end(token)
+            while len(self._cache) > LOOKUP_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def lookup(self, token):
+        hits = self._cached(token)
+        if hits is None:
+            hits = self._resolve(token)
+            self._remember(token, hits)
+        return hits
+
+    def lookup_many(self, tokens):
+        """lookup() of every token, with the plain numbers of a page searched in one go."""
+        resolved = {}
+        digits = {}
+        for token in tokens:
+            if token in resolved or token in digits:
+                continue
+            hits = self._cached(token)
+            if hits is not None:
+                resolved[token] = hits
+                continue
+            cleaned = _SEPARATORS.sub("", token)
+            if cleaned.isascii() and cleaned.isdigit():
+                digits[token] = cleaned.lstrip("0").encode()
+            else:
+                resolved[token] = self._resolve(token)
+                self._remember(token, resolved[token])
+        for token, pos in zip(digits, self._positions(list(digits.values())).tolist()):
+            resolved[token] = self._entries(pos) if pos >= 0 else {}
+            self._remember(token, resolved[token])
+        return [resolved[token] for token in tokens]
+
+    def _resolve(self, token):
+        cleaned = _SEPARATORS.sub("", token)
+        if cleaned.isdigit():
+            if cleaned.isascii():
+                pos = int(self._positions([cleaned.lstrip("0").encode()])[0])
+                if pos >= 0:
+                    return self._entries(pos)
+            return {}
+
+        masked = _MASKED.fullmatch(cleaned)
+        if not masked or len(masked.group(1)) < self.min_suffix:
+            return {}
+        prefix = masked.group(1)[::-1].encode()
+        lo = int(np.searchsorted(self.rkeys, prefix, side="left"))
+        hi = int(np.searchsorted(self.rkeys, prefix + b":", side="right"))  # ":" sorts right after "9"
+        # An ambiguous suffix (several master IDs end with it) matches nothing.
+        if hi - lo != 1:
+            return {}
+        return self._entries(int(self.rkey_pos[lo]))
+
+    is_candidate = staticmethod(is_candidate)
+
+
+def candidate_tokens(words, index):
+    """
+    Returns the page words plus one merged pseudo-word for every run of short digit
+    groups on the same line ("1234 5678 9012") that resolves in the index. Merged
+    entries have the same tuple shape as `page.get_text("words")` entries, with the
+    union of the group boxes, so callers can treat them like any other word.
+    """
+    tokens = list(words)
+    run = []
+
+    def flush():
+        if len(run) > 1:
+            text = "".join(w[4] for w in run)
+            if index.lookup(text):
+                first = run[0]
+                tokens.append((
+                    min(w[0] for w in run), min(w[1] for w in run),
+                    max(w[2] for w in run), max(w[3] for w in run),
+                    text,
+                ) + tuple(first[5:]))
+        run.clear()
+
+    for w in words:
+        text = w[4].strip("-")
+        same_line = run and len(w) > 6 and w[5:7] == run[-1][5:7]
+        if text.isdigit() and len(text) <= MAX_GROUP_DIGITS:
+            if run and not same_line:
+                flush()
+            run.append(w[:4] + (text,) + tuple(w[5:]))
+        else:
+            flush()
+    flush()
+    return tokens
@@ -1,15 +1,28 @@
 import streamlit as st
-import pf_full_code
-import bank_full_code
-import esic_full_code
-import archival_full_code
 import base64
+import importlib
+import os
+import threading
 
 # Set page config
 st.set_page_config(page_title="Core Integra", page_icon=":office:", layout="wide")
 
 # Path to logo
 logo_path = "C:/CORE INTEGRIA/logo.jpg"  # Change if needed
+if not os.path.exists(logo_path):
+    logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logo.jpg")
+
+# Section modules are imported on first use, not at startup.
+SECTIONS = {
+    'pf': ("pf_full_code", "run_pf_section"),
+    'bank': ("bank_full_code", "run_bank_section"),
+    'esic': ("esic_full_code", "run_esic_section"),
+    'archival': ("archival_full_code", "run_archival_section"),
+    'combined': ("combined_full_code", "run_combined_section"),
+}
+
+# Heavy dependencies warmed in the background once per process.
+HEAVY_MODULES = ["pandas", "numpy", "fitz", "xlsxwriter", "statement_engine"]
 
 # ---------- CSS ---------- #
 
@@ -86,13 +99,57 @@ sidebar_css = """
 
 # ---------- Utility ---------- #
 
-def get_base64_image(image_path):
+@st.cache_data(show_spinner=False)
+def get_image_bytes(image_path):
     with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
+        return img_file.read()
+
+@st.cache_data(show_spinner=False)
+def get_base64_image(image_path):
+    return base64.b64encode(get_image_bytes(image_path)).decode()
+
+@st.cache_data(show_spinner=False)
+def get_login_header(image_path):
+    return f"""
+            <div class="login-box">
+                <img src="data:image/jpeg;base64,{get_base64_image(image_path)}" />
+                <div class="login-title">Welcome to Core Integra</div>
+        """
+
+def _import_heavy_modules():
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+@st.cache_resource(show_spinner=False)
+def warm_dependencies():
+    """
+    Starts importing pandas/PyMuPDF/etc. in a background thread, once per process, so
+    the login page renders without waiting for them and the first section is fast.
+    """
+    thread = threading.Thread(target=_import_heavy_modules, name="warm-dependencies", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource(show_spinner=False)
+def start_metrics():
+    """Starts the ops metrics exporters configured in the environment (see ops_metrics.py)."""
+    import ops_metrics
+
+    ops_metrics.start_exporters()
+    return True
+
+def load_section(section):
+    module_name, function_name = SECTIONS[section]
+    return getattr(importlib.import_module(module_name), function_name)
 
 # ---------- App Logic ---------- #
 
 def main():
+    warm_dependencies()
+    start_metrics()
     if 'authenticated' not in st.session_state:
         st.session_state.authenticated = False
     if 'selected_section' not in st.session_state:
@@ -110,11 +167,7 @@ def show_login_page():
 
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        st.markdown(f"""
-            <div class="login-box">
-                <img src="data:image/jpeg;base64,{get_base64_image(logo_path)}" />
-                <div class="login-title">Welcome to Core Integra</div>
-        """, unsafe_allow_html=True)
+        st.markdown(get_login_header(logo_path), unsafe_allow_html=True)
 
         username = st.text_input("Username")
         password = st.text_input("Password", type="password")
@@ -130,7 +183,7 @@ def show_login_page():
 
 def show_sidebar():
     with st.sidebar:
-        st.image(logo_path, width=160)
+        st.image(get_image_bytes(logo_path), width=160)
         st.markdown("---")
 
         if st.button("PF"):
@@ -145,6 +198,9 @@ def show_sidebar():
         if st.button("ARCHIVAL"):
             st.session_state.selected_section = 'archival'
 
+        if st.button("ALL STATEMENTS"):
+            st.session_state.selected_section = 'combined'
+
         st.markdown("---")
         if st.button("LOGOUT"):
             st.session_state.authenticated = False
@@ -154,14 +210,8 @@ def show_sidebar():
 def show_selected_dashboard():
     section = st.session_state.selected_section
 
-    if section == 'pf':
-        pf_full_code.run_pf_section()
-    elif section == 'bank':
-        bank_full_code.run_bank_section()
-    elif section == 'esic':
-        esic_full_code.run_esic_section()
-    elif section == 'archival':
-        archival_full_code.run_archival_section()
+    if section in SECTIONS:
+        load_section(section)()
     else:
         st.subheader("Welcome! Use the sidebar to choose a section.")
 
@@ -0,0 +1,139 @@
+"""
+OCR fallback for scanned (image-only) statement pages.
+
+Pages without a text layer yield no words, so every ID on them would go unmatched
+silently. Such pages are detected from the page resources before extraction, and only
+those pages are sent to Tesseract (through PyMuPDF's OCR text page) in a process pool. The OCR'd word boxes
+are cached on disk by a hash of the page content, so re-running the same statement
+does not OCR it again; the words then go through the normal matching path. The cache
+holds statement text, so it lives in a directory only the current user can read
+(OCR_CACHE_DIR, default ~/.core_integra/ocr_cache), and one process pool, created on
+first use, serves every PDF of every run.
+
+OCR needs a local Tesseract installation (TESSDATA_PREFIX pointing at its tessdata).
+Without it, image-only pages are reported back instead of being skipped silently.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from page_fingerprint import page_content_hash
+from run_checkpoint import private_directory
+
+OCR_LANGUAGE = os.environ.get("OCR_LANGUAGE", "eng")
+OCR_DPI = 300
+OCR_CACHE_DIR = os.environ.get(
+    "OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".core_integra", "ocr_cache")
+)
+OCR_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache_ready = False
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS)
+        return _pool
+
+
+def ocr_available():
+    """True if PyMuPDF can find Tesseract's language data."""
+    try:
+        return bool(fitz.get_tessdata())
+    except Exception:
+        return False
+
+
+def is_image_only(page):
+    """
+    A page that uses no fonts but does draw images is a scan. This only inspects the
+    page resources, so it is much cheaper than extracting the text to find out.
+    """
+    return not page.get_fonts() and bool(page.get_images())
+
+
+def _cache_path(key):
+    global _cache_ready
+    if not _cache_ready:
+        private_directory(OCR_CACHE_DIR, "OCR_CACHE_DIR")
+        _cache_ready = True
+    return os.path.join(OCR_CACHE_DIR, f"{key}.json")
+
+
+def _read_cache(key):
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8") as f:
+            return [tuple(w) for w in json.load(f)]
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(key, words):
+    tmp_path = f"{_cache_path(key)}.{os.getpid()}_{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(words, f)
+    os.replace(tmp_path, _cache_path(key))
+
+
+def _ocr_page_bytes(page_pdf_bytes, language, dpi):
+    """Process-pool worker: OCRs a one-page PDF and returns its word tuples."""
+    doc = fitz.open(stream=page_pdf_bytes, filetype="pdf")
+    page = doc[0]
+    textpage = page.get_textpage_ocr(language=language, dpi=dpi, full=True)
+    words = [tuple(w) for w in page.get_text("words", textpage=textpage)]
+    doc.close()
+    return words
+
+
+def ocr_pages(doc, page_numbers, page_hashes=None):
+    """
+    Returns {page number: words} for the given image-only pages, from the cache where
+    possible and otherwise by OCR in the shared process pool. Returns an empty dict when
+    Tesseract is not available. page_hashes are fingerprints the caller already has.
+    The words cover the whole page; callers apply their own extraction band.
+    """
+    if not page_numbers or not ocr_available():
+        return {}
+
+    results = {}
+    pending = {}
+    for pno in page_numbers:
+        key = (page_hashes or {}).get(pno) or page_content_hash(doc, doc[pno])
+        cached = _read_cache(key)
+        if cached is not None:
+            results[pno] = cached
+        else:
+            pending[pno] = key
+
+    if pending:
+        # Ship each page as its own tiny PDF so workers never receive the whole file.
+        payloads = {}
+        for pno in pending:
+            single = fitz.open()
+            single.insert_pdf(doc, from_page=pno, to_page=pno)
+            payloads[pno] = single.tobytes()
+            single.close()
+
+        if len(payloads) == 1:
+            pno, payload = next(iter(payloads.items()))
+            ocr_results = {pno: _ocr_page_bytes(payload, OCR_LANGUAGE, OCR_DPI)}
+        else:
+            pool = _get_pool()
+            futures = {
+                pno: pool.submit(_ocr_page_bytes, payload, OCR_LANGUAGE, OCR_DPI)
+                for pno, payload in payloads.items()
+            }
+            ocr_results = {pno: future.result() for pno, future in futures.items()}
+
+        for pno, words in ocr_results.items():
+            _write_cache(pending[pno], words)
+            results[pno] = words
+
+    return results
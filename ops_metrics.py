@@ -0,0 +1,252 @@
+"""
+Operational metrics for the statement runs, in the Prometheus text format.
+
+The engine records pages processed, per-stage latencies, active / queued runs, busy
+workers and bytes in and out per section (PF, ESIC, BANK, ARCHIVAL) into a small
+in-process registry; peak RSS is read when metrics are exported. Nothing is exported
+unless configured:
+
+  METRICS_PORT=9464            serve http://<METRICS_HOST>:9464/metrics for scraping
+  METRICS_TEXTFILE=/path.prom  rewrite the file every METRICS_INTERVAL seconds (default
+                               15), for node_exporter's textfile collector
+
+Exporters are started once per process by start_exporters() (main.py, api_server.py).
+"""
+import bisect
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers a fast page (ms) up to a whole month-end run.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+_metrics = {}  # name -> Metric
+
+
+class Metric:
+    def __init__(self, name, kind, help_text, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.buckets = buckets
+        self.values = {}  # sorted label items -> value, or [bucket counts, sum, count]
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+
+    def set_max(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = max(self.values.get(key, value), value)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self.values.items())
+            items = [(key, [list(v[0]), v[1], v[2]] if self.kind == "histogram" else v) for key, v in items]
+        for key, value in items:
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{_labels(key)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(items):
+    if not items:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric(name, kind, help_text, buckets=None):
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = Metric(name, kind, help_text, buckets)
+        return _metrics[name]
+
+
+PAGES = _metric("statement_pages_processed_total", "counter", "Statement pages routed.")
+PDFS = _metric("statement_pdfs_processed_total", "counter", "Statement PDFs routed.")
+STAGE_SECONDS = _metric(
+    "statement_stage_seconds", "histogram", "Latency of a processing stage.", LATENCY_BUCKETS
+)
+RUN_SECONDS = _metric("statement_run_seconds", "histogram", "Duration of a whole run.", LATENCY_BUCKETS)
+PAGES_PER_SECOND = _metric("statement_last_run_pages_per_second", "gauge", "Throughput of the last finished run.")
+ACTIVE_RUNS = _metric("statement_runs_active", "gauge", "Runs currently processing.")
+QUEUED_RUNS = _metric("statement_runs_queued", "gauge", "Runs (API jobs) waiting for a worker.")
+WORKERS_BUSY = _metric("statement_workers_busy", "gauge", "Workers of a pool currently busy.")
+WORKERS_CAPACITY = _metric("statement_workers_capacity", "gauge", "Size of a worker pool.")
+INPUT_BYTES = _metric("statement_input_bytes_total", "counter", "Bytes of uploaded files.")
+OUTPUT_BYTES = _metric("statement_output_bytes_total", "counter", "Bytes of generated outputs.")
+PEAK_RSS = _metric("process_peak_rss_bytes", "gauge", "Peak resident set size of this process.")
+
+
+@contextmanager
+def timed(stage, section):
+    """Records the duration of the block as one observation of a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, section=section)
+
+
+@contextmanager
+def busy(pool, capacity=None):
+    """Counts a worker of `pool` as busy for the duration of the block."""
+    if capacity is not None:
+        WORKERS_CAPACITY.set(capacity, pool=pool)
+    WORKERS_BUSY.inc(pool=pool)
+    try:
+        yield
+    finally:
+        WORKERS_BUSY.dec(pool=pool)
+
+
+@contextmanager
+def track_run(section, pages=lambda: 0):
+    """
+    Marks a run of a section as active for the duration of the block; on exit records
+    its duration and throughput. `pages` returns the number of pages routed.
+    """
+    ACTIVE_RUNS.inc(section=section)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        ACTIVE_RUNS.dec(section=section)
+        RUN_SECONDS.observe(elapsed, section=section)
+        if elapsed > 0:
+            PAGES_PER_SECOND.set(round(pages() / elapsed, 3), section=section)
+
+
+def peak_rss_bytes():
+    """Peak RSS of this process, or None where it cannot be read."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil  # Windows: no resource module
+
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", None) or info.rss
+    except ImportError:
+        return None
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    rss = peak_rss_bytes()
+    if rss is not None:
+        PEAK_RSS.set_max(rss)
+    with _lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics_", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_started = False
+
+
+def start_exporters():
+    """Starts the exporters configured in the environment, once per process."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        server = ThreadingHTTPServer((os.environ.get("METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+    path = os.environ.get("METRICS_TEXTFILE")
+    if path:
+        interval = float(os.environ.get("METRICS_INTERVAL", "15"))
+
+        def write_forever():
+            while True:
+                try:
+                    write_textfile(path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        threading.Thread(target=write_forever, name="metrics-textfile", daemon=True).start()
@@ -0,0 +1,392 @@
+"""
+Pipelined output generation: unit PDFs are built while other statements are still
+being routed, instead of after the whole run.
+
+Stages, each overlapping the one before:
+  1. routing (StatementRun, as before)
+  2. with render_early=True, as each PDF's routing result is recorded, its pages for
+     every unit that has a match so far are copied and annotated into a per-(unit, PDF)
+     partial PDF in the spool directory, in a process pool (rendering holds the GIL
+     in-process)
+  3. for each unit asked for, its missing partials and its Excel reports are built side
+     by side in the same pool, then the partials are concatenated and packed with the
+     reports into the unit's ZIP, several units at a time
+
+The master rows are grouped by unit for the reports as soon as the pipeline starts,
+in a thread. The reports themselves overlap the PDF rendering, not routing: a unit's
+matched IDs - and so both of its workbooks - are only final once every PDF is routed.
+Partials whose pages changed after they were rendered (duplicate pages suppressed by
+find_duplicates) are rendered again in stage 3. Stage 2 renders every matched unit,
+so it is only for callers that take every unit right after routing (the HTTP API);
+by default (render_early=False) partials are only rendered for the units stage 3 is
+started for - the ones downloaded, as with rendering on demand in StatementRun.
+
+The pool is shared by every run in the process, so each run feeds it through its own
+queue (RunQueue), at most OUTPUT_WORKERS tasks at a time and most urgent first: a unit
+someone waits for (a download, the unit being written), then units built ahead of it,
+then background work (stage 2, start_units). A one-unit download waits for the few
+tasks in flight, not for every unit already queued by this or another session.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, CancelledError, Future, ProcessPoolExecutor, wait
+
+import fitz  # PyMuPDF
+
+import ops_metrics
+from statement_engine import RunCancelled, apply_annotations, pack_unit_zip, plan_unit_page, rows_reports
+from statement_profiles import get_profile
+
+OUTPUT_WORKERS = min(4, os.cpu_count() or 1)
+CANCEL_POLL = 0.25  # seconds between checks of the run's cancel event while waiting
+
+# RunQueue priorities, most urgent first.
+PRIORITY_WAITED = 0  # a unit someone is waiting for
+PRIORITY_AHEAD = 1  # units built ahead of the one being written
+PRIORITY_BACKGROUND = 2  # stage 2 partials and start_units
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OUTPUT_WORKERS)
+        return _pool
+
+
+def _render_partial(path, pages, out_path):
+    """
+    Process-pool worker: copies [(page number, annotations)] of a PDF, in runs of
+    consecutive pages, annotates them and saves the partial PDF. Returns the seconds taken.
+    """
+    start = time.perf_counter()
+    src = fitz.open(path)
+    out = fitz.open()
+    try:
+        first = 0
+        while first < len(pages):
+            last = first
+            while last + 1 < len(pages) and pages[last + 1][0] == pages[last][0] + 1:
+                last += 1
+            out.insert_pdf(src, from_page=pages[first][0], to_page=pages[last][0])
+            first = last + 1
+        for page, (_, annotations) in zip(out, pages):
+            apply_annotations(page, annotations)
+        out.save(out_path)
+    finally:
+        out.close()
+        src.close()
+    return time.perf_counter() - start
+
+
+def _build_reports(profile_name, rows, matched_ids):
+    """Process-pool worker: a unit's matched and unmatched Excel reports, as bytes."""
+    return rows_reports(rows, get_profile(profile_name), matched_ids)
+
+
+def _finish_unit(profile_name, unit, partial_paths, reports):
+    """Process-pool worker: concatenates a unit's partials and packs its ZIP with `reports`."""
+    out = fitz.open()
+    try:
+        for path in partial_paths:
+            with fitz.open(path) as part:
+                out.insert_pdf(part)
+        pdf_bytes = out.tobytes()
+    finally:
+        out.close()
+    return pack_unit_zip(get_profile(profile_name), unit, pdf_bytes, None, None, reports)
+
+
+class RunQueue:
+    """
+    One run's tasks for the shared pool: at most `limit` are submitted at a time, the
+    rest wait here by priority (then in order), so they can still be moved up or
+    cancelled. submit() returns a Future of its own that follows the pool's future.
+    """
+
+    def __init__(self, pool, limit=OUTPUT_WORKERS):
+        self.pool = pool
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._heap = []  # [priority, order, future or None once superseded, fn, args]
+        self._queued = {}  # future -> its current heap entry
+        self._order = itertools.count()
+        self._running = 0
+
+    def submit(self, priority, fn, *args):
+        future = Future()
+        entry = [priority, next(self._order), future, fn, args]
+        with self._lock:
+            heapq.heappush(self._heap, entry)
+            self._queued[future] = entry
+        self._pump()
+        return future
+
+    def promote(self, future, priority):
+        """Moves a task that is still queued up to `priority`."""
+        with self._lock:
+            entry = self._queued.get(future)
+            if entry is None or entry[0] <= priority:
+                return
+            entry[2] = None
+            self._queued[future] = [priority, next(self._order), future, entry[3], entry[4]]
+            heapq.heappush(self._heap, self._queued[future])
+        self._pump()
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if self._running >= self.limit or not self._heap:
+                    return
+                _, _, future, fn, args = heapq.heappop(self._heap)
+                if future is None:
+                    continue
+                del self._queued[future]
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running += 1
+            try:
+                pool_future = self.pool.submit(fn, *args)
+            except Exception as e:  # pool shut down or broken
+                with self._lock:
+                    self._running -= 1
+                future.set_exception(e)
+                continue
+            pool_future.add_done_callback(lambda done, future=future: self._done(future, done))
+
+    def _done(self, future, pool_future):
+        with self._lock:
+            self._running -= 1
+        if pool_future.cancelled():
+            future.set_exception(CancelledError())
+        elif pool_future.exception() is not None:
+            future.set_exception(pool_future.exception())
+        else:
+            future.set_result(pool_future.result())
+        self._pump()
+
+
+def _when_all_done(futures, callback):
+    """Calls callback() once every future is done (right away if there are none)."""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def one_done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+
+    if not futures:
+        callback()
+    for future in futures:
+        future.add_done_callback(one_done)
+
+
+class OutputPipeline:
+    """
+    Attaches to a StatementRun before routing (run.pipeline); the run then feeds it every
+    recorded result and takes unit ZIPs from it. Must be closed before the run's spool.
+    Nothing here blocks while holding the lock: units are chained with callbacks and
+    only the callers of unit_zip / unit_zips wait.
+    """
+
+    def __init__(self, run, pool=None, render_early=False, max_running=OUTPUT_WORKERS):
+        self.run = run
+        self.render_early = render_early
+        self.queue = RunQueue(pool or _get_pool(), max_running)
+        self.directory = os.path.join(run.spool.directory, "partials")
+        os.makedirs(self.directory, exist_ok=True)
+        # Reentrant: a task that fails on submit runs its callbacks in the submitting thread.
+        self._lock = threading.RLock()
+        self._source_pages = {}  # source -> {unit: [page numbers]} from its routing result
+        self._partials = {}  # (unit, source) -> (page numbers, partial path, future)
+        self._finished = {}  # unit -> [future of the unit ZIP, its queued tasks, priority]
+        self._serial = 0
+        # The reports only need the master rows of each unit: group them right away.
+        self._grouping = threading.Thread(target=run.master.unit_rows, args=(None,), daemon=True)
+        self._grouping.start()
+        run.pipeline = self
+
+    def _submit_partial(self, unit, source, pages, priority):
+        run = self.run
+        profile = run.master.profile
+        planned = [
+            (pno, plan_unit_page(run.analyses[(source, pno)], unit, profile, run.mode)[0]) for pno in pages
+        ]
+        self._serial += 1
+        path = os.path.join(self.directory, f"{source:04d}_{self._serial:06d}.pdf")
+        future = self.queue.submit(priority, _render_partial, run.sources[source], planned, path)
+        future.add_done_callback(self._observe_render)
+        self._partials[(unit, source)] = (tuple(pages), path, future)
+
+    def _observe_render(self, future):
+        if not future.cancelled() and future.exception() is None:
+            ops_metrics.STAGE_SECONDS.observe(future.result(), stage="render", section=self.run.master.profile.name)
+
+    def source_done(self, source, result):
+        """Stage 2: renders the new PDF's partials, and earlier PDFs' partials of newly matched units."""
+        with self._lock:
+            self._source_pages[source] = result["unit_pages"]
+            if not self.render_early:
+                return
+            for unit, matches in self.run.matched.items():
+                if not matches:
+                    continue
+                for done_source, unit_pages in self._source_pages.items():
+                    pages = unit_pages.get(unit)
+                    if pages and (unit, done_source) not in self._partials:
+                        self._submit_partial(unit, done_source, pages, PRIORITY_BACKGROUND)
+
+    def _unit_future(self, unit, priority):
+        """
+        Stage 3 for one unit, started once: re-renders stale partials, then packs the ZIP
+        once they are done. Returns the future of the unit ZIP without waiting; asking
+        again with a more urgent priority moves the unit's queued tasks up.
+        """
+        with self._lock:
+            entry = self._finished.get(unit)
+            if entry is not None:
+                entry[2] = min(entry[2], priority)
+                for task in entry[1]:
+                    self.queue.promote(task, priority)
+                return entry[0]
+            by_source = {}
+            for source, pno in sorted(self.run.unit_pages.get(unit, [])):
+                by_source.setdefault(source, []).append(pno)
+            for source, pages in by_source.items():
+                partial = self._partials.get((unit, source))
+                if partial is None or partial[0] != tuple(pages) or partial[2].cancelled():
+                    self._submit_partial(unit, source, pages, priority)
+            partials = [self._partials[(unit, source)] for source in sorted(by_source)]
+            tasks = [future for _, _, future in partials]
+            for task in tasks:
+                self.queue.promote(task, priority)
+            entry = self._finished[unit] = [Future(), tasks, priority]
+        # The Excel reports are built next to the partials, not after them.
+        reports = self.run.stored_reports(unit)
+        if reports is None:
+            self._grouping.join()
+            rows = self.run.master.unit_rows(unit)
+            with self._lock:
+                reports = self.queue.submit(
+                    entry[2], _build_reports, self.run.master.profile.name, rows, set(self.run.matched[unit])
+                )
+                tasks.append(reports)
+        paths = [path for _, path, _ in partials]
+        _when_all_done(list(tasks), lambda: self._pack_unit(unit, entry, paths, reports))
+        return entry[0]
+
+    def _pack_unit(self, unit, entry, paths, reports):
+        """Called once a unit's partials and reports are done: queues the ZIP packing."""
+        future, tasks, _ = entry
+        if not future.set_running_or_notify_cancel():
+            return
+        failed = next((task for task in tasks if task.cancelled() or task.exception() is not None), None)
+        if failed is not None:
+            self._fail(unit, entry, CancelledError() if failed.cancelled() else failed.exception())
+            return
+        if isinstance(reports, Future):
+            reports = reports.result()
+        with self._lock:
+            task = self.queue.submit(entry[2], _finish_unit, self.run.master.profile.name, unit, paths, reports)
+            entry[1] = [task]
+        task.add_done_callback(lambda done: self._packed(unit, entry, done))
+
+    def _packed(self, unit, entry, task):
+        if task.cancelled() or task.exception() is not None:
+            self._fail(unit, entry, CancelledError() if task.cancelled() else task.exception())
+        else:
+            entry[0].set_result(task.result())
+
+    def _fail(self, unit, entry, exception):
+        # A cancelled or failed unit is started again the next time it is asked for.
+        with self._lock:
+            if self._finished.get(unit) is entry:
+                del self._finished[unit]
+        entry[0].set_exception(exception)
+
+    def _wait(self, futures, cancel=None):
+        """
+        Waits for futures; once `cancel` is set, drops the tasks not started yet and
+        raises RunCancelled (tasks in a worker finish on their own).
+        """
+        pending = futures
+        while pending:
+            if cancel is not None and cancel.is_set():
+                self.cancel_pending()
+                raise RunCancelled()
+            done, pending = wait(pending, timeout=CANCEL_POLL, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
+
+    def _all_futures(self):
+        with self._lock:
+            futures = [future for _, _, future in self._partials.values()]
+            for future, tasks, _ in self._finished.values():
+                futures.append(future)
+                futures.extend(tasks)
+        return futures
+
+    def cancel_pending(self):
+        """Cancels the queued tasks; partials and units cancelled this way are started again if needed."""
+        for future in self._all_futures():
+            future.cancel()
+        with self._lock:
+            self._finished = {unit: entry for unit, entry in self._finished.items() if not entry[0].cancelled()}
+
+    def start_units(self, units):
+        """
+        Starts stage 3 for the units in the background (routing must be complete), for
+        callers that will take every unit; units asked for later still go first.
+        """
+        for unit in units:
+            self._unit_future(unit, PRIORITY_BACKGROUND)
+
+    def unit_future(self, unit):
+        """The future of the unit's ZIP bytes, moved ahead of queued work; does not wait."""
+        return self._unit_future(unit, PRIORITY_WAITED)
+
+    def unit_zip(self, unit):
+        future = self.unit_future(unit)
+        self._wait([future])
+        return future.result()
+
+    def unit_zips(self, units, window=2 * OUTPUT_WORKERS, cancel=None):
+        """
+        (unit, ZIP bytes) in the given order, with up to `window` units built ahead.
+        Once `cancel` is set, RunCancelled is raised instead of waiting for more renders.
+        """
+        units = list(units)
+        for index, unit in enumerate(units):
+            future = self._unit_future(unit, PRIORITY_WAITED)
+            for ahead in units[index + 1:index + window]:
+                self._unit_future(ahead, PRIORITY_AHEAD)
+            self._wait([future], cancel)
+            yield unit, future.result()
+            with self._lock:
+                self._finished.pop(unit, None)
+
+    def reset(self):
+        """Drops finished unit ZIPs (their pages or matches changed)."""
+        with self._lock:
+            self._finished = {}
+
+    def close(self):
+        """Cancels or waits for this run's pending work, so the spool can be removed."""
+        futures = self._all_futures()
+        # Cancel everything first: while waiting, the queue would start queued work.
+        running = [future for future in futures if not future.cancel()]
+        for future in running:
+            try:
+                future.result()
+            except BaseException:
+                pass
+        self.run.pipeline = None
@@ -0,0 +1,30 @@
+"""
+Content fingerprints for PDF pages.
+
+Two pages with the same fingerprint draw the same thing: identical content streams,
+Form XObjects, fonts and image data on the same page size. Used to recognise pages
+that appear again in overlapping uploads (the same statement uploaded twice, a monthly
+file plus a corrected partial) and to key the OCR cache.
+
+Pages that draw through Form XObjects (e.g. placed with show_pdf_page) all have the
+same short content stream ("q /fzFrm0 Do Q"); what they show lives in the forms, so
+the forms' streams are part of the fingerprint. Object numbers are not: the same page
+in two different files must still fingerprint the same.
+"""
+import hashlib
+
+
+def page_content_hash(doc, page):
+    """Hash of the page's content streams, Form XObjects, fonts, image data and size."""
+    digest = hashlib.sha256()
+    digest.update(page.read_contents())
+    # get_xobjects(), get_fonts() and get_images() include what nested forms reference.
+    for xref, _name, _invoker, bbox in page.get_xobjects():
+        digest.update(doc.xref_stream_raw(xref) or b"")
+        digest.update(repr((tuple(bbox), doc.xref_get_key(xref, "Matrix"))).encode())
+    for font in page.get_fonts():
+        digest.update(repr(font[1:]).encode())
+    for image in page.get_images():
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    digest.update(repr(tuple(page.rect)).encode())
+    return digest.hexdigest()
@@ -0,0 +1,92 @@
+"""
+Low-resolution previews of annotated unit pages.
+
+A preview renders only the selected pages of one unit: each page is copied on its own
+from the spooled source, annotated with the unit's plan (statement_engine.plan_unit_page)
+and rasterised at a small zoom, in a process pool. PNGs are kept in an in-memory LRU
+cache keyed by the page content fingerprint and the annotation plan, so the cache key
+covers the document, page, unit and mode; switching an option back, or re-running the
+same statements, shows previews without rendering them again.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from statement_engine import apply_annotations, plan_unit_page
+
+PREVIEW_ZOOM = 0.6
+PREVIEW_CACHE_SIZE = 256
+PREVIEW_MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _render_page(path, pno, annotations, zoom):
+    """Process-pool worker: one annotated page of a PDF on disk, as PNG bytes."""
+    src = fitz.open(path)
+    out = fitz.open()
+    try:
+        out.insert_pdf(src, from_page=pno, to_page=pno)
+        page = out[0]
+        apply_annotations(page, annotations)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), annots=True).tobytes("png")
+    finally:
+        out.close()
+        src.close()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PREVIEW_MAX_WORKERS)
+        return _pool
+
+
+def _cache_get(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    return None
+
+
+def _cache_put(key, png):
+    with _cache_lock:
+        _cache[key] = png
+        _cache.move_to_end(key)
+        while len(_cache) > PREVIEW_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def render_previews(run, unit, pages, zoom=PREVIEW_ZOOM):
+    """
+    PNG previews of a unit's pages, [(source, page number)] of a StatementRun, in the
+    given order. Only pages missing from the cache are rendered.
+    """
+    profile = run.master.profile
+    jobs = []
+    for source, pno in pages:
+        annotations, _, _, _ = plan_unit_page(run.analyses[(source, pno)], unit, profile, run.mode)
+        fingerprint = run.page_hashes.get((source, pno)) or (run.sources[source], pno)
+        jobs.append(((fingerprint, tuple(annotations), zoom), run.sources[source], pno, annotations))
+
+    previews = {key: _cache_get(key) for key, _, _, _ in jobs}
+    pending = [job for job in jobs if previews[job[0]] is None]
+    if len(pending) == 1:
+        key, path, pno, annotations = pending[0]
+        previews[key] = _render_page(path, pno, annotations, zoom)
+        _cache_put(key, previews[key])
+    elif pending:
+        pool = _get_pool()
+        futures = {key: pool.submit(_render_page, path, pno, annotations, zoom) for key, path, pno, annotations in pending}
+        for key, future in futures.items():
+            previews[key] = future.result()
+            _cache_put(key, previews[key])
+    return [previews[key] for key, _, _, _ in jobs]
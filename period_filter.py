@@ -0,0 +1,85 @@
+"""
+Statement period detection, used to skip pages outside the selected month.
+
+Bank statements and consolidated PF / ESIC files often span several months. With a
+period filter the engine looks for dates on each page (transaction dates, "Statement
+for Jan 2025", wage month "01/2025", ...) right after extraction, and pages whose dates
+all fall in other months are dropped before any ID matching, annotation or page copy.
+
+A page without any date belongs to the same statement section as the page before it
+(continuation pages, totals), so it follows that page's decision; until the first date
+is seen, pages are kept.
+
+Only years from MIN_YEAR to MAX_YEAR count: PF / ESIC rows put amounts right after
+names, so "SUNITA MAY 1800 1800 216" must not read as May 1800.
+"""
+import re
+
+MIN_YEAR, MAX_YEAR = 1990, 2100
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+_DMY = re.compile(r"(?<![\d/.\-])(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{4}|\d{2})(?![\d/.\-])")
+_YMD = re.compile(r"(?<![\d/.\-])(\d{4})[/.\-](\d{1,2})[/.\-](\d{1,2})(?![\d/.\-])")
+# "May" only capitalised: the verb "may" is common in statement footers.
+_MONTH_NAMES = (
+    r"(?i:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)|May|MAY"
+)
+# "Jan 15, 2025" / "Jan 2025", "January, 2025", "Jan-2025" / "Jan-25", "Jan'25", "Jan/25".
+# A two-digit year must follow the month directly, so "Jan 15" is not read as 2015.
+_MONTH_YEAR = re.compile(
+    r"\b(" + _MONTH_NAMES + r")\.?"
+    r"(?:\s+(\d{1,2})(?i:st|nd|rd|th)?,?\s+(\d{4})|[\s\-/,']*(\d{4})|[\-/'](\d{2}))\b"
+)
+_MM_YYYY = re.compile(r"(?<![\d/.\-])(\d{1,2})[/\-](\d{4})(?![\d/.\-])")
+
+
+def period_from_ui(month, year):
+    """(year, month number) from a section's month selectbox value ("jan".."dec") and year."""
+    return int(year), MONTHS.index(month.lower()[:3]) + 1
+
+
+def _year(text):
+    """The year a date's year field stands for, or None outside MIN_YEAR..MAX_YEAR."""
+    year = int(text)
+    if year < 100:
+        year += 2000
+    return year if MIN_YEAR <= year <= MAX_YEAR else None
+
+
+def text_periods(text):
+    """Every (year, month) a date in the text refers to."""
+    periods = set()
+    for day, month, year in _DMY.findall(text):
+        if 1 <= int(day) <= 31 and 1 <= int(month) <= 12:
+            periods.add((_year(year), int(month)))
+    for year, month, day in _YMD.findall(text):
+        if 1 <= int(day) <= 31 and 1 <= int(month) <= 12:
+            periods.add((_year(year), int(month)))
+    for month, day, dated_year, year, short_year in _MONTH_YEAR.findall(text):
+        if day and not 1 <= int(day) <= 31:
+            continue
+        periods.add((_year(dated_year or year or short_year), MONTHS.index(month.lower()[:3]) + 1))
+    for month, year in _MM_YYYY.findall(text):
+        if 1 <= int(month) <= 12:
+            periods.add((_year(year), int(month)))
+    return {period for period in periods if period[0] is not None}
+
+
+def page_periods(words):
+    """(year, month) periods mentioned on a page, from its extracted words."""
+    return frozenset(text_periods(" ".join(w[4] for w in words)))
+
+
+class PeriodFilter:
+    """Decides page by page, in order, whether a page belongs to `period` (year, month)."""
+
+    def __init__(self, period):
+        self.period = tuple(period)
+        self._last = True
+
+    def keep(self, periods):
+        if periods:
+            self._last = self.period in periods
+        return self._last
@@ -0,0 +1,166 @@
+"""
+Streamlit view of a finished run.
+
+A run only holds page routing and match results (statement_engine.StatementRun). This
+view lists the units with output; a unit's ZIP is rendered the first time it is
+selected and cached on the run, and the ZIP of all units is only built when asked for.
+Single pages can be previewed before downloading anything (see page_preview.py).
+"""
+import time
+
+import streamlit as st
+
+
+def remember_run(key, run, zip_name=None):
+    """Keeps the run in the session (replacing and closing the previous one)."""
+    previous = st.session_state.get(key)
+    if previous is not None and previous is not run:
+        previous.close()
+    st.session_state[key] = run
+    st.session_state[f"{key}_zip_name"] = zip_name
+    st.session_state.pop(f"{key}_all_ready", None)
+
+
+def start_cancellable(key, run, zip_name=None):
+    """
+    Shows a Cancel button while the run is processed. Clicking it makes Streamlit stop
+    the script at its next element update; StatementRun.processing() then cancels the
+    run, so worker threads stop at their next page boundary.
+    """
+    st.session_state[f"{key}_active"] = (run, zip_name)
+    st.button("⏹ Cancel", key=f"{key}_cancel", on_click=_cancel_active, args=(key,))
+
+
+def _cancel_active(key):
+    active = st.session_state.pop(f"{key}_active", None)
+    if active is not None:
+        active[0].cancel()
+        st.session_state[f"{key}_cancelled"] = active
+
+
+def finish_cancellable(key):
+    """The run finished: the Cancel button of its script run no longer applies."""
+    st.session_state.pop(f"{key}_active", None)
+
+
+def show_cancelled(key, keep_partial=False):
+    """
+    After a cancelled run: with keep_partial, the output of the PDFs it finished is
+    offered for download; otherwise the run is closed and its memory freed right away.
+    A run still marked active was interrupted by another widget and is treated the same.
+    """
+    cancelled = st.session_state.pop(f"{key}_cancelled", None) or st.session_state.pop(f"{key}_active", None)
+    if cancelled is None:
+        return
+    run, zip_name = cancelled
+    run.cancel()
+    if keep_partial and run.output_units():
+        # A partial run must not become the previous run of diff mode.
+        run.history = None
+        remember_run(key, run, zip_name)
+        st.warning(f"Run cancelled. The output below only covers the {len(run.routed)} PDF(s) finished before cancelling.")
+    else:
+        run.close()
+        st.warning("Run cancelled.")
+
+
+def show_resumed(run):
+    """Tells the user how many PDFs were picked up from an interrupted run's checkpoint."""
+    if run.resumed:
+        st.info(f"Resumed {run.resumed} PDF(s) from the checkpoint of an earlier run with the same master and options.")
+
+
+def show_duplicates(run):
+    """Reports uploads that repeat pages (or whole files) of earlier uploads."""
+    for line in run.duplicate_report():
+        st.warning(f"Duplicate pages: {line}")
+
+
+def show_out_of_period(run):
+    """Lists the pages the period filter left out, so nothing is dropped silently."""
+    for line in run.out_of_period_report():
+        st.info(line)
+
+
+def show_changes(run):
+    """Diff mode: the change summary against the named previous run of the statement type."""
+    if run.history is None:
+        return
+    if run.history.saved is None:
+        st.info("No previous run to compare with yet; this run is stored for the next one.")
+        return
+    from run_history import UNCHANGED, summary_line
+
+    changes = run.changes()
+    saved = time.strftime("%d %b %Y %H:%M", time.localtime(run.history.saved))
+    st.info(
+        f"Compared with the run \"{run.history.name}\" of {saved}: {summary_line(changes)}. "
+        "Unchanged units reuse their earlier Excel reports."
+    )
+    changed = [change for change in changes if change["status"] != UNCHANGED]
+    if changed:
+        st.dataframe(changed, hide_index=True)
+
+
+def show_run_downloads(key, master_label):
+    run = st.session_state.get(key)
+    if run is None:
+        return
+    units = run.output_units()
+    if not units:
+        return
+    st.subheader("Download")
+    selected = st.multiselect(
+        f"Select units to download ({len(units)} with output)",
+        options=units,
+        key=f"{key}_units",
+    )
+    for unit in selected:
+        st.download_button(
+            label=f"⬇️ {unit}",
+            data=run.unit_zip(unit),
+            file_name=run.unit_zip_name(unit),
+            mime="application/zip",
+            key=f"{key}_download_{unit}",
+        )
+
+    if st.button("Prepare ZIP of all units", key=f"{key}_all"):
+        st.session_state[f"{key}_all_ready"] = True
+    if st.session_state.get(f"{key}_all_ready"):
+        st.download_button(
+            label=master_label,
+            data=run.master_zip(),
+            file_name=st.session_state.get(f"{key}_zip_name") or "output.zip",
+            mime="application/zip",
+            key=f"{key}_download_all",
+        )
+
+    show_previews(key, run, units)
+
+
+def show_previews(key, run, units):
+    """Renders low-resolution previews of the pages picked for one unit."""
+    with st.expander("Preview pages"):
+        unit = st.selectbox("Unit", options=units, key=f"{key}_preview_unit")
+        # A combined run holds one run per statement type.
+        runs = {name: r for name, r in getattr(run, "runs", {None: run}).items() if unit in r.output_units()}
+        if len(runs) > 1:
+            statement_run = runs[st.radio("Statement", options=list(runs), horizontal=True, key=f"{key}_preview_type")]
+        else:
+            statement_run = next(iter(runs.values()))
+
+        pages = sorted(statement_run.unit_pages.get(unit, []))
+        labels = {page: f"{statement_run.names[page[0]]} - page {page[1] + 1}" for page in pages}
+        selected = st.multiselect(
+            "Pages",
+            options=pages,
+            default=pages[:2],
+            format_func=labels.get,
+            key=f"{key}_preview_pages_{statement_run.master.profile.name}_{unit}",
+        )
+        if selected:
+            from page_preview import render_previews
+
+            with st.spinner("Rendering previews..."):
+                images = render_previews(statement_run, unit, selected)
+            st.image(images, caption=[labels[page] for page in selected], width=420)
@@ -0,0 +1,124 @@
+"""
+Checkpoints of routed PDFs, so an interrupted run resumes instead of restarting.
+
+Each PDF's routing result (statement_engine.route_pdf) is written to a run workspace as
+soon as that PDF completes. The workspace is keyed by everything the result depends on:
+the statement profile, the master rows, the masking and page modes. Shards inside it
+are keyed by a hash of the PDF file. After a Streamlit rerun, a browser refresh or a
+crashed worker, generating again with the same master and PDFs picks up every
+completed PDF from disk and only routes the rest.
+
+Workspaces older than CHECKPOINT_MAX_AGE are removed when a new run starts (not for
+max_age=None, e.g. the watch folder's month-long workspaces under its own root).
+
+Shards are pickles, and loading a pickle can run code, so they are only kept in a
+directory private to the current user: RUN_CHECKPOINT_DIR, by default
+~/.core_integra/runs, is created with mode 0700 and refused if another user owns it.
+RUN_CHECKPOINTS=0 turns checkpointing off by default (the sections have an option for
+it, and the API follows the setting).
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+
+from statement_profiles import PROFILES
+
+CHECKPOINT_DIR = os.environ.get(
+    "RUN_CHECKPOINT_DIR", os.path.join(os.path.expanduser("~"), ".core_integra", "runs")
+)
+CHECKPOINTS_ENABLED = os.environ.get("RUN_CHECKPOINTS", "1") != "0"
+CHECKPOINT_MAX_AGE = 7 * 24 * 3600  # seconds
+# Bump when the routing result format changes, so old shards are not reused.
+CHECKPOINT_VERSION = 3
+_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _master_digest(master):
+    import pandas as pd
+
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(master.df, index=False).values.tobytes())
+    digest.update(repr(list(master.df.columns)).encode())
+    return digest.hexdigest()
+
+
+def private_directory(path, setting="RUN_CHECKPOINT_DIR"):
+    """
+    Creates `path` readable and writable by the current user only; refuses another
+    user's. `setting` names the environment variable that moves the directory.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):  # Windows: profile directories are private already
+        return path
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid():
+        raise PermissionError(
+            f"Directory {path} belongs to another user; set {setting} to a private directory."
+        )
+    if stat.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+def prune_workspaces(root=CHECKPOINT_DIR, max_age=CHECKPOINT_MAX_AGE):
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class RunCheckpoint:
+    """The workspace of one run configuration; load()/save() one shard per PDF."""
+
+    def __init__(self, master, mode, page_mode, root=CHECKPOINT_DIR, period=None, max_age=CHECKPOINT_MAX_AGE):
+        profile = master.profile
+        digest = hashlib.sha256()
+        for part in (CHECKPOINT_VERSION, profile.name, repr(PROFILES.get(profile.name)), mode, page_mode, period):
+            digest.update(repr(part).encode())
+        digest.update(_master_digest(master).encode())
+        private_directory(root)
+        if max_age is not None:
+            prune_workspaces(root, max_age)
+        self.directory = os.path.join(root, f"{profile.name}_{digest.hexdigest()[:24]}")
+        os.makedirs(self.directory, exist_ok=True)
+        os.utime(self.directory)
+
+    def _shard_path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def load(self, key):
+        """The checkpointed routing result for a PDF digest, or None."""
+        try:
+            with open(self._shard_path(key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def save(self, key, result):
+        tmp_path = f"{self._shard_path(key)}.{os.getpid()}_{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._shard_path(key))
+
+    def completed(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".pkl"))
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,167 @@
+"""
+Month-over-month diff of unit outputs.
+
+After a run's ZIP of all units is produced, the run's per-unit state is stored as the
+"previous run": the matched IDs, the page count and two signatures per unit, plus the
+unit's Excel reports and ZIP:
+  signature  what the reports are built from: matched IDs, the unit's master rows,
+             profile and mode. It does not depend on the month's pages, so a unit whose
+             matches are the same as last month is "unchanged" and reuses its reports.
+  content    the signature plus the fingerprints and annotations of the unit's pages.
+             Only an identical re-run has the same content; then the whole ZIP is reused.
+A new month's PDF is always rendered from its own pages.
+
+In diff mode the next run compares against it, and the ZIP of all units gets a compact
+change summary (changes.csv). Each history is named by its caller (e.g. after the client
+or master file), so sessions working on different masters keep separate baselines;
+they live in a private directory under RUN_HISTORY_DIR (default ~/.core_integra/history).
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+
+from run_checkpoint import private_directory
+
+HISTORY_DIR = os.environ.get(
+    "RUN_HISTORY_DIR", os.path.join(os.path.expanduser("~"), ".core_integra", "history")
+)
+CHANGES_FILE = "changes.csv"
+# Bump when the stored unit state changes, so older histories are not compared against.
+HISTORY_VERSION = 2
+
+UNCHANGED, CHANGED, NEW, REMOVED = "unchanged", "changed", "new", "removed"
+
+
+class RunHistory:
+    """The stored previous run named `name` of one statement type (see module docstring)."""
+
+    def __init__(self, profile_name, name, root=HISTORY_DIR):
+        private_directory(root, "RUN_HISTORY_DIR")
+        key = hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+        self.name = name
+        self.directory = os.path.join(root, f"{profile_name}_{key}")
+        self.zip_dir = os.path.join(self.directory, "units")
+        os.makedirs(self.zip_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.saved = None
+        self.units = {}  # unit -> {"signature", "content", "matched", "pages"}
+        try:
+            with open(os.path.join(self.directory, "index.json"), encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == HISTORY_VERSION:
+                self.saved, self.units = index["saved"], index["units"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _path(self, key, kind):
+        return os.path.join(self.zip_dir, f"{key}.{kind}")
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, path, data):
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def has_zip(self, content):
+        return os.path.exists(self._path(content, "zip"))
+
+    def stored_zip(self, content):
+        """The unit ZIP stored for a content signature, or None if it must be built."""
+        return self._read(self._path(content, "zip"))
+
+    def store_zip(self, content, zip_bytes):
+        self._write(self._path(content, "zip"), zip_bytes)
+
+    def stored_reports(self, signature):
+        """(matched, unmatched) Excel bytes stored for a signature, or None."""
+        matched = self._read(self._path(signature, "matched.xlsx"))
+        unmatched = self._read(self._path(signature, "unmatched.xlsx"))
+        return (matched, unmatched) if matched is not None and unmatched is not None else None
+
+    def store_reports(self, signature, matched_bytes, unmatched_bytes):
+        self._write(self._path(signature, "matched.xlsx"), matched_bytes)
+        self._write(self._path(signature, "unmatched.xlsx"), unmatched_bytes)
+
+    def diff(self, current):
+        """
+        Changes against the stored run. `current` is {unit: {"signature", "matched",
+        "pages"}} of this run; returns one dict per unit of either run, in that order.
+        """
+        changes = []
+        for unit in list(current) + [unit for unit in self.units if unit not in current]:
+            now = current.get(unit)
+            before = self.units.get(unit)
+            if before is None:
+                status = NEW
+            elif now is None:
+                status = REMOVED
+            else:
+                status = UNCHANGED if now["signature"] == before["signature"] else CHANGED
+            now_ids, before_ids = set(now["matched"]) if now else set(), set(before["matched"]) if before else set()
+            page_change = (now["pages"] if now else 0) - (before["pages"] if before else 0)
+            changes.append({
+                "unit": unit,
+                "status": status,
+                "ids_added": len(now_ids - before_ids),
+                "ids_removed": len(before_ids - now_ids),
+                "pages_added": max(page_change, 0),
+                "pages_removed": max(-page_change, 0),
+            })
+        return changes
+
+    def commit(self, current):
+        """Makes `current` the previous run; stored outputs no unit refers to are removed."""
+        with self._lock:
+            index = {"version": HISTORY_VERSION, "saved": time.time(), "units": current}
+            path = os.path.join(self.directory, "index.json")
+            tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, path)
+            keep = set()
+            for entry in current.values():
+                keep.update((
+                    f"{entry['content']}.zip",
+                    f"{entry['signature']}.matched.xlsx",
+                    f"{entry['signature']}.unmatched.xlsx",
+                ))
+            for name in os.listdir(self.zip_dir):
+                if name not in keep and not name.endswith(".tmp"):
+                    os.remove(os.path.join(self.zip_dir, name))
+            self.saved, self.units = index["saved"], current
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def changes_csv(changes):
+    """The change summary as CSV bytes, changed units first."""
+    order = {CHANGED: 0, NEW: 1, REMOVED: 2, UNCHANGED: 3}
+    buffer = io.StringIO()
+    writer = csv.DictWriter(
+        buffer, fieldnames=["unit", "status", "ids_added", "ids_removed", "pages_added", "pages_removed"]
+    )
+    writer.writeheader()
+    writer.writerows(sorted(changes, key=lambda change: order[change["status"]]))
+    return buffer.getvalue().encode("utf-8")
+
+
+def summary_line(changes):
+    counts = {status: 0 for status in (CHANGED, NEW, REMOVED, UNCHANGED)}
+    for change in changes:
+        counts[change["status"]] += 1
+    return ", ".join(f"{count} {status}" for status, count in counts.items())
@@ -0,0 +1,96 @@
+"""
+Routing statement PDFs in worker processes over one shared master index.
+
+PyMuPDF text extraction holds the GIL, so threads only overlap I/O. Worker processes
+give real parallelism, but pickling a MasterData (a DataFrame, ID arrays and a unit
+automaton) into every task would cost more than the page work for large masters.
+Instead the master's ID index (id_index.PackedIdIndex, already flat arrays) is saved
+once to disk and each worker memory-maps it the first time it sees it; tasks only
+carry a small descriptor and a PDF path.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ops_metrics
+from id_index import PackedIdIndex
+from statement_profiles import get_profile
+from unit_locator import UnitMatcher
+
+PROCESS_WORKERS = min(4, os.cpu_count() or 1)
+
+# Per worker process: descriptor directory -> WorkerMaster.
+_attached = {}
+
+
+class WorkerMaster:
+    """The parts of MasterData that routing needs, rebuilt in a worker from a descriptor."""
+
+    def __init__(self, descriptor):
+        self.profile = get_profile(descriptor["profile"])
+        self.units = list(descriptor["units"])
+        self.index = PackedIdIndex.load(descriptor["directory"], self.units, descriptor["min_suffix"])
+        self.unit_matcher = UnitMatcher(self.units) if self.profile.unit_label else None
+
+
+def share_master(master, directory):
+    """Writes the master's packed ID index under `directory`; returns the task descriptor."""
+    master.index.save(directory)
+    return {
+        "profile": master.profile.name,
+        "units": master.units,
+        "min_suffix": master.index.min_suffix,
+        "directory": directory,
+    }
+
+
+def _route_worker(descriptor, pdf_path, mode, page_mode, period=None):
+    from statement_engine import route_pdf
+
+    master = _attached.get(descriptor["directory"])
+    if master is None:
+        master = _attached[descriptor["directory"]] = WorkerMaster(descriptor)
+    # A per-task page cache still fingerprints every page for duplicate detection.
+    return route_pdf(pdf_path, master, mode, page_mode, page_cache={}, period=period)
+
+
+def route_in_processes(run, sources, page_mode, on_result=None, max_workers=PROCESS_WORKERS):
+    """
+    Routes sources of a StatementRun in a process pool and records the results on the
+    run (checkpointed PDFs are resumed without a worker). on_result(source, result) is
+    called in the calling process as each PDF finishes. Once the run is cancelled, PDFs
+    not started yet are dropped and RunCancelled is raised; PDFs in flight in a worker
+    finish first (the workers cannot see the run's cancel event).
+    """
+    pending = []
+    for source in sources:
+        result = run.resume(source)
+        if result is not None:
+            run.add_result(source, result)
+            if on_result:
+                on_result(source, result)
+        else:
+            pending.append(source)
+    if not pending:
+        return
+
+    descriptor = share_master(run.master, os.path.join(run.spool.directory, "master_index"))
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+        futures = {
+            pool.submit(_route_worker, descriptor, run.sources[source], run.mode, page_mode, run.period): source
+            for source in pending
+        }
+        for future in as_completed(futures):
+            if run.cancelled.is_set():
+                from statement_engine import RunCancelled
+
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise RunCancelled()
+            source = futures[future]
+            result = future.result()
+            # Counted here: the worker's own metrics registry is not exported.
+            ops_metrics.PAGES.inc(result["page_count"], section=run.master.profile.name)
+            ops_metrics.PDFS.inc(section=run.master.profile.name)
+            run.save_checkpoint(source, result)
+            run.add_result(source, result)
+            if on_result:
+                on_result(source, result)
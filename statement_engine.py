@@ -0,0 +1,841 @@
+"""
+Shared processing core for the PF, ESIC and BANK statements.
+
+The sections only own their Streamlit layout; loading the master, matching IDs on each
+page, annotating and packaging the per-unit outputs all run here, driven by the layout
+profile of the statement type (see statement_profiles.py).
+
+Per page the words are extracted, resolved against the master index and laid out into
+highlight geometry exactly once. A run only keeps that page routing and the match
+results; a unit's PDF, reports and ZIP are rendered the first time they are asked for.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+import pandas as pd
+
+import ops_metrics
+from id_index import PackedIdIndex, candidate_tokens, normalize_id
+from ocr_fallback import is_image_only, ocr_pages
+from page_fingerprint import page_content_hash
+from period_filter import PeriodFilter, page_periods
+from statement_profiles import PROFILES, unrotated_rect
+from run_checkpoint import file_digest
+from run_history import CHANGES_FILE, changes_csv
+from upload_spool import UploadSpool
+from unit_locator import UnitMatcher, locate_units
+from word_geometry import PageWords, as_tuples, band_mask, candidate_mask, offset_rects, row_rects
+
+# Read-only annotation flag (prevents moving/editing in most PDF viewers)
+ANNOT_FLAG_READONLY = 64
+
+HIGHLIGHT_FILL = (1, 1, 0)  # Yellow
+MASK_FILL = (0.5, 0.5, 0.5)  # Gray
+
+# Normalized processing modes; each section maps its own UI labels onto these.
+MODE_HIGHLIGHT = "highlight"
+MODE_MASK = "mask"
+PAGES_ALL = "all"
+PAGES_RELEVANT = "relevant"
+
+
+# ----------------------- Master -----------------------
+
+class MasterData:
+    """The unit master for one statement type, indexed once per run."""
+
+    def __init__(self, df, profile):
+        self.df = df
+        self.profile = profile
+        self.unit_ids = {}
+        for unit, value in zip(df["UNIT"], df[profile.id_column]):
+            self.unit_ids.setdefault(unit, []).append(value)
+        self.units = list(self.unit_ids)
+        self.index = PackedIdIndex.from_ids(self.unit_ids)
+        self.unit_matcher = UnitMatcher(self.units) if profile.unit_label else None
+        self._unit_rows = None
+
+    def unit_rows(self, unit):
+        if self._unit_rows is None:
+            self._unit_rows = {u: rows for u, rows in self.df.groupby("UNIT", sort=False)}
+        return self._unit_rows.get(unit, self.df.iloc[0:0])
+
+
+def load_master(excel_file, profile):
+    """
+    Reads the master Excel file for a statement type. The ID column is read as text so
+    leading zeros survive, and kept as written: the reports show the master's IDs, only
+    the index (id_index.PackedIdIndex) normalizes them. Raises ValueError if the
+    required columns are missing.
+    """
+    df = pd.read_excel(excel_file, dtype={profile.id_column: str})
+    if "UNIT" not in df.columns or profile.id_column not in df.columns:
+        raise ValueError(
+            f"The Excel file must contain 'UNIT' and '{profile.id_column}' columns. "
+            "Please upload the proper file."
+        )
+    return MasterData(df, profile)
+
+
+def load_masters(excel_file, profiles):
+    """
+    Reads one master Excel file holding the ID columns of several statement types and
+    returns {profile name: MasterData}. The file is read once; each statement type only
+    keeps the rows that have an ID for it (IDs kept as written, as in load_master). Raises ValueError if a column is missing.
+    """
+    id_columns = [profile.id_column for profile in profiles]
+    df = pd.read_excel(excel_file, dtype={column: str for column in id_columns})
+    missing = [column for column in ["UNIT"] + id_columns if column not in df.columns]
+    if missing:
+        raise ValueError(
+            f"The Excel file must contain 'UNIT' and {', '.join(repr(c) for c in id_columns)} columns "
+            f"(missing: {', '.join(missing)}). Please upload the proper file."
+        )
+    # Each statement type only sees its own ID column, whichever types were asked for.
+    all_id_columns = {spec["id_column"] for spec in PROFILES.values()}
+    masters = {}
+    for profile in profiles:
+        frame = df.drop(columns=[c for c in df.columns if c in all_id_columns and c != profile.id_column])
+        masters[profile.name] = MasterData(frame[frame[profile.id_column].map(normalize_id) != ""], profile)
+    return masters
+
+
+# ----------------------- Page Analysis -----------------------
+
+def open_pdf(pdf_file):
+    """
+    Opens a file path (preferred: MuPDF reads pages from disk on demand, see
+    upload_spool.py), an uploaded file or another file-like object.
+    """
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return fitz.open(pdf_file)
+    if hasattr(pdf_file, "getvalue"):
+        return fitz.open(stream=pdf_file.getvalue(), filetype="pdf")
+    return fitz.open(stream=pdf_file.read(), filetype="pdf")
+
+
+def extract_words(page, profile):
+    """
+    The page's words for matching, read with the profile's extraction settings: only
+    the statement band, and no ligature / whitespace preservation (IDs are digits).
+    """
+    return page.get_text("words", clip=profile.text_clip(page), flags=profile.text_flags)
+
+
+def clip_words(page, profile, words):
+    """
+    Words from another source (OCR) cut to the profile's extraction band, so they cover
+    the same part of the page as extract_words(); a word is kept if its centre is inside.
+    """
+    clip = profile.text_clip(page)
+    if clip is None:
+        return words
+    return [
+        w for w in words
+        if clip.x0 <= (w[0] + w[2]) / 2 <= clip.x1 and clip.y0 <= (w[1] + w[3]) / 2 <= clip.y1
+    ]
+
+
+def analyze_page(page, profile, master, words=None, unit_words=None):
+    """
+    Everything about a page that does not depend on the unit (`words` overrides the
+    page's own text layer, e.g. with OCR results; `unit_words`, by default `words`, are
+    the words unit names are looked for in, e.g. the page outside the extraction band):
+      - hits:       [(rect, {unit: (master IDs)})] for every ID candidate on the page,
+      - units:      units with at least one matched ID on the page,
+      - body_rows:  row rectangles outside the header/footer bands ("rows" masking only),
+      - unit_rects: {unit: [rects]} where the unit name is printed (if the profile labels units).
+    """
+    if words is None:
+        words = extract_words(page, profile)
+    tokens = PageWords(candidate_tokens(words, master.index))
+
+    rows_needed = profile.highlight_kind == "row" or profile.mask_kind == "rows"
+    rows = row_rects(tokens.coords, PageWords(words).coords, profile.row_tolerance) if rows_needed else None
+
+    body_rows = set()
+    if profile.mask_kind == "rows":
+        page_height = unrotated_rect(page).height
+        header_limit = profile.header_limit(page.number, page_height)
+        footer_limit = profile.footer_limit(page_height)
+        body_rows.update(as_tuples(rows[band_mask(rows, header_limit, footer_limit)]))
+
+    is_id = candidate_mask(tokens.texts, lambda text: master.index.is_candidate(text, profile.id_regex))
+    if profile.highlight_kind == "row":
+        rects = as_tuples(rows[is_id])
+    else:
+        rects = as_tuples(offset_rects(tokens.coords[is_id], profile.offsets))
+
+    hits = []
+    units = set()
+    for rect, unit_hits in zip(rects, master.index.lookup_many(tokens.texts[is_id].tolist())):
+        hits.append((rect, unit_hits))
+        units.update(unit_hits)
+
+    if unit_words is None:
+        unit_words = words
+    unit_rects = locate_units(unit_words, master.unit_matcher) if master.unit_matcher else {}
+    return {"hits": hits, "units": units, "body_rows": body_rows, "unit_rects": unit_rects}
+
+
+def plan_unit_page(analysis, unit, profile, mode):
+    """
+    Works out the annotations for one unit's copy of a page without touching the PDF.
+    Returns (annotations, matched master IDs, highlight count, mask count), where each
+    annotation is (rect, fill, opacity, readonly).
+    """
+    annotations = []
+    matched = set()
+    highlights = 0
+    masks = 0
+    highlighted = set()
+
+    for rect, unit_hits in analysis["hits"]:
+        if unit in unit_hits:
+            matched.update(unit_hits[unit])
+            fill = profile.matched_fill if mode == MODE_MASK else HIGHLIGHT_FILL
+            annotations.append((rect, fill, 0.3, True))
+            highlighted.add(rect)
+            highlights += 1
+        elif mode == MODE_MASK and profile.mask_kind == "candidates":
+            annotations.append((rect, MASK_FILL, 1, True))
+            masks += 1
+
+    label = profile.unit_label
+    if label:
+        for rect in analysis["unit_rects"].get(unit, []):
+            annotations.append((tuple(rect), label["color"], label["opacity"], label["readonly"]))
+            highlighted.add(tuple(rect))
+            if label["counted"]:
+                highlights += 1
+
+    if mode == MODE_MASK and profile.mask_kind == "rows":
+        for row in analysis["body_rows"] - highlighted:
+            annotations.append((row, MASK_FILL, 1.0, True))
+            masks += 1
+
+    return annotations, matched, highlights, masks
+
+
+def apply_annotations(page, annotations):
+    for rect, fill, opacity, readonly in annotations:
+        annot = page.add_rect_annot(fitz.Rect(rect))
+        annot.set_colors(stroke=fill, fill=fill)
+        annot.set_border(width=1)
+        annot.set_opacity(opacity)
+        if readonly:
+            annot.set_flags(ANNOT_FLAG_READONLY)
+        annot.update()
+
+
+# ----------------------- PDF Routing -----------------------
+
+class RunCancelled(Exception):
+    """Raised by route_pdf (and StatementRun.route) once the run has been cancelled."""
+
+
+def route_pdf(pdf_file, master, mode, page_mode, on_page=None, ocr=True, page_cache=None, period=None, cancel=None):
+    """
+    Works out which pages of one statement PDF go to which unit, and what each unit
+    matched, without copying or annotating any page (see StatementRun for rendering).
+
+    mode:       MODE_HIGHLIGHT or MODE_MASK.
+    page_mode:  PAGES_ALL keeps every page for every unit; PAGES_RELEVANT keeps a page for a
+                unit only if it holds one of the unit's IDs, plus the profile's always-keep pages.
+    on_page:    optional callback(page_number, total_pages) called after each page.
+    ocr:        OCR scanned pages (no text layer) before matching, see ocr_fallback.py.
+    page_cache: optional {(page fingerprint, is first page): analysis} shared across a run;
+                a page already analysed (in this or another upload) is not extracted or
+                matched again.
+    period:     optional (year, month); pages dated in other months are dropped right
+                after extraction, before matching (see period_filter.py).
+    cancel:     optional threading.Event; once set, RunCancelled is raised at the next
+                page boundary.
+
+    Returns a dict with:
+      unit_pages  {unit: [page numbers]} for units that received at least one page,
+      analyses    {page number: analyze_page() result} for every routed page,
+      matched     {unit: set of matched master IDs},
+      highlight, mask, page_count  annotation and page counts,
+      ocr_pages        page numbers whose words came from OCR,
+      unreadable_pages page numbers that are images without any usable text,
+      page_hashes      {page number: content fingerprint} (only with a page_cache),
+      reused_pages     number of pages whose analysis came from the page_cache,
+      out_of_period_pages  page numbers dropped by the period filter.
+    """
+    profile = master.profile
+    route_start = time.perf_counter()
+    doc = open_pdf(pdf_file)
+    try:
+        total_pages = doc.page_count
+
+        unit_pages = {}
+        analyses = {}
+        matched = {unit: set() for unit in master.units}
+        highlight_count = 0
+        mask_count = 0
+        unreadable_pages = []
+        reused_pages = 0
+        out_of_period_pages = []
+        period_filter = PeriodFilter(period) if period else None
+
+        # Fingerprint every page first; header bands differ on the first page, so that is part of the key.
+        page_hashes = {}
+        cached = {}
+        if page_cache is not None:
+            for page in doc:
+                page_hashes[page.number] = page_content_hash(doc, page)
+                analysis = page_cache.get((page_hashes[page.number], page.number == 0))
+                if analysis is not None:
+                    cached[page.number] = analysis
+
+        if cancel is not None and cancel.is_set():
+            raise RunCancelled()
+
+        # OCR all scanned pages up front, in parallel, so the main loop stays in page order.
+        scanned = [page.number for page in doc if page.number not in cached and is_image_only(page)] if ocr else []
+        with ops_metrics.timed("ocr", profile.name):
+            ocr_words = ocr_pages(doc, scanned, page_hashes)
+
+        for page in doc:
+            if cancel is not None and cancel.is_set():
+                raise RunCancelled()
+            analysis = cached.get(page.number)
+            if analysis is not None:
+                reused_pages += 1
+                if period_filter and not period_filter.keep(analysis["periods"]):
+                    out_of_period_pages.append(page.number)
+                    analysis = None
+            else:
+                page_start = time.perf_counter()
+                # Unit names are located on the whole page, IDs and dates only in the band.
+                page_words = ocr_words.get(page.number)
+                if page_words is None and master.unit_matcher is not None and profile.text_band:
+                    page_words = page.get_text("words", flags=profile.text_flags)
+                if page_words is None:
+                    words = extract_words(page, profile)
+                else:
+                    words = clip_words(page, profile, page_words)
+                if not words and page.get_images():
+                    unreadable_pages.append(page.number)
+                periods = page_periods(words) if period_filter else None
+                if period_filter and not period_filter.keep(periods):
+                    out_of_period_pages.append(page.number)
+                else:
+                    analysis = analyze_page(page, profile, master, words, unit_words=page_words)
+                    analysis["periods"] = periods
+                    if page_cache is not None:
+                        page_cache[(page_hashes[page.number], page.number == 0)] = analysis
+                ops_metrics.STAGE_SECONDS.observe(time.perf_counter() - page_start, stage="page", section=profile.name)
+
+            if analysis is None:
+                if on_page:
+                    on_page(page.number, total_pages)
+                continue
+            if page_mode == PAGES_ALL or profile.keeps_page(page.number, total_pages):
+                page_units = master.units
+            else:
+                page_units = [unit for unit in master.units if unit in analysis["units"]]
+
+            if page_units:
+                analyses[page.number] = analysis
+            for unit in page_units:
+                unit_pages.setdefault(unit, []).append(page.number)
+                _, unit_matched, h, m = plan_unit_page(analysis, unit, profile, mode)
+                matched[unit].update(unit_matched)
+                highlight_count += h
+                mask_count += m
+
+            if on_page:
+                on_page(page.number, total_pages)
+
+    finally:
+        doc.close()
+    ops_metrics.PAGES.inc(total_pages, section=profile.name)
+    ops_metrics.PDFS.inc(section=profile.name)
+    ops_metrics.STAGE_SECONDS.observe(time.perf_counter() - route_start, stage="route_pdf", section=profile.name)
+    return {
+        "unit_pages": unit_pages,
+        "analyses": analyses,
+        "matched": matched,
+        "highlight": highlight_count,
+        "mask": mask_count,
+        "page_count": total_pages,
+        "ocr_pages": sorted(ocr_words),
+        "unreadable_pages": unreadable_pages,
+        "page_hashes": page_hashes,
+        "reused_pages": reused_pages,
+        "out_of_period_pages": out_of_period_pages,
+    }
+
+
+def scan_warning(file_name, result):
+    """User-facing warning for scanned pages that could not be read, or None."""
+    if not result["unreadable_pages"]:
+        return None
+    pages = ", ".join(str(pno + 1) for pno in result["unreadable_pages"])
+    return (
+        f"⚠️ {file_name}: page(s) {pages} are scanned images without a text layer and could "
+        "not be OCR'd (is Tesseract installed?). IDs on those pages were not matched."
+    )
+
+
+# ----------------------- Output -----------------------
+
+def _excel_bytes(frame, sheet_name):
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        if sheet_name:
+            frame.to_excel(writer, index=False, sheet_name=sheet_name)
+        else:
+            frame.to_excel(writer, index=False)
+    return buffer.getvalue()
+
+
+def unit_reports(master, unit, matched_ids):
+    """Matched and unmatched master rows of a unit, as Excel bytes."""
+    return rows_reports(master.unit_rows(unit), master.profile, matched_ids)
+
+
+def rows_reports(rows, profile, matched_ids):
+    """Matched and unmatched reports of a unit's master rows, as Excel bytes."""
+    is_matched = rows[profile.id_column].isin(matched_ids)
+    sheets = profile.sheet_names or (None, None)
+    return _excel_bytes(rows[is_matched], sheets[0]), _excel_bytes(rows[~is_matched], sheets[1])
+
+
+def build_unit_zip(master, unit, pdf_bytes, matched_ids, reports=None):
+    """
+    One unit's ZIP: the merged statement PDF plus its matched/unmatched reports
+    (`reports`, (matched, unmatched) Excel bytes, if they are already built).
+    """
+    return pack_unit_zip(master.profile, unit, pdf_bytes, master.unit_rows(unit), matched_ids, reports)
+
+
+def pack_unit_zip(profile, unit, pdf_bytes, rows, matched_ids, reports=None):
+    """build_unit_zip from the unit's master rows, for callers without the MasterData."""
+    matched_bytes, unmatched_bytes = reports or rows_reports(rows, profile, matched_ids)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as unit_zip:
+        unit_zip.writestr(profile.file_name("pdf", unit), pdf_bytes)
+        unit_zip.writestr(profile.file_name("matched", unit), matched_bytes)
+        unit_zip.writestr(profile.file_name("unmatched", unit), unmatched_bytes)
+    return buffer.getvalue()
+
+
+def build_master_zip(master, unit_zip_data, extra_files=None):
+    """The download ZIP holding every unit's ZIP (and `extra_files`, {name: bytes})."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as master_zip:
+        for unit, zip_bytes in unit_zip_data.items():
+            master_zip.writestr(master.profile.file_name("folder", unit), zip_bytes)
+        for name, data in (extra_files or {}).items():
+            master_zip.writestr(name, data)
+    return buffer.getvalue()
+
+
+def page_ranges(pages):
+    """Sorted (source, page) keys as (source, first page, last page) runs of consecutive pages."""
+    ranges = []
+    for source, pno in sorted(pages):
+        if ranges and ranges[-1][0] == source and ranges[-1][2] == pno - 1:
+            ranges[-1][2] = pno
+        else:
+            ranges.append([source, pno, pno])
+    return [tuple(r) for r in ranges]
+
+
+class StatementRun:
+    """
+    The page routing and match results of one run over a set of statement PDFs.
+    Unit outputs are rendered on first request and cached; nothing is rendered for
+    units nobody downloads. With a checkpoint (run_checkpoint.RunCheckpoint) every
+    routed PDF is saved as it completes and PDFs completed by an earlier, interrupted
+    run are not routed again. With a period (year, month), pages dated in other months
+    are skipped (period_filter.py); the checkpoint must be created with the same period.
+    """
+
+    def __init__(self, master, mode, checkpoint=None, period=None):
+        self.master = master
+        self.mode = mode
+        self.checkpoint = checkpoint
+        self.period = period
+        self.resumed = 0
+        self.page_count = 0
+        self.out_of_period = []
+        self._digests = {}
+        self.spool = UploadSpool()
+        self.sources = []
+        self.names = []
+        self.unit_pages = {}
+        self.analyses = {}
+        self.matched = {unit: set() for unit in master.units}
+        self.highlight = 0
+        self.mask = 0
+        # Page analyses shared by every upload of the run, keyed by page fingerprint.
+        self.page_cache = {}
+        self.page_hashes = {}
+        self.reused_pages = 0
+        self.duplicates = {}
+        self._unit_zips = {}
+        self._master_zip = None
+        # Set by output_pipeline.OutputPipeline to build unit outputs while routing.
+        self.pipeline = None
+        self.cancelled = threading.Event()
+        self.routed = set()
+        # Diff mode: a run_history.RunHistory; unchanged units reuse its stored ZIPs.
+        self.history = None
+        self._unit_states = None
+
+    def add_upload(self, upload):
+        """Spools an upload (or registers a file path) and returns its source index."""
+        self.sources.append(self.spool.add(upload))
+        ops_metrics.INPUT_BYTES.inc(os.path.getsize(self.sources[-1]), section=self.master.profile.name)
+        self.names.append(getattr(upload, "name", None) or os.path.basename(self.sources[-1]))
+        return len(self.sources) - 1
+
+    def source_digest(self, source):
+        if source not in self._digests:
+            self._digests[source] = file_digest(self.sources[source])
+        return self._digests[source]
+
+    def resume(self, source, on_page=None):
+        """The checkpointed routing result of a source, or None if it must be routed."""
+        if self.checkpoint is None:
+            return None
+        result = self.checkpoint.load(self.source_digest(source))
+        if result is None:
+            return None
+        result["resumed"] = True
+        for pno, analysis in result["analyses"].items():
+            self.page_cache.setdefault((result["page_hashes"][pno], pno == 0), analysis)
+        if on_page:
+            for pno in range(result["page_count"]):
+                on_page(pno, result["page_count"])
+        return result
+
+    def save_checkpoint(self, source, result):
+        result["resumed"] = False
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.source_digest(source), result)
+
+    def route(self, source, page_mode, on_page=None):
+        """Routes one source; safe to call from worker threads. Raises RunCancelled after cancel()."""
+        if self.cancelled.is_set():
+            raise RunCancelled()
+        result = self.resume(source, on_page=on_page)
+        if result is None:
+            with ops_metrics.busy("route"):
+                result = route_pdf(
+                    self.sources[source], self.master, self.mode, page_mode,
+                    on_page=on_page, page_cache=self.page_cache, period=self.period, cancel=self.cancelled,
+                )
+            self.save_checkpoint(source, result)
+        return result
+
+    def add_result(self, source, result):
+        for unit, pages in result["unit_pages"].items():
+            self.unit_pages.setdefault(unit, []).extend((source, pno) for pno in pages)
+        for pno, analysis in result["analyses"].items():
+            self.analyses[(source, pno)] = analysis
+        for pno, key in result["page_hashes"].items():
+            self.page_hashes[(source, pno)] = key
+        self.reused_pages += result["reused_pages"]
+        self.out_of_period.extend((source, pno) for pno in result.get("out_of_period_pages", ()))
+        self.resumed += bool(result.get("resumed"))
+        for unit, matches in result["matched"].items():
+            self.matched[unit].update(matches)
+        self.highlight += result["highlight"]
+        self.mask += result["mask"]
+        self.page_count += result["page_count"]
+        self.routed.add(source)
+        self._master_zip = None
+        self._unit_states = None
+        if self.pipeline is not None:
+            self.pipeline.source_done(source, result)
+
+    @contextmanager
+    def processing(self):
+        """
+        Marks this run as active in the ops metrics (ops_metrics.py). If the block is left
+        by an exception - including Streamlit stopping the script because the user
+        clicked Cancel or another widget - the run is cancelled, so routing still in
+        flight in worker threads stops at its next page boundary.
+        """
+        with ops_metrics.track_run(self.master.profile.name, lambda: self.page_count):
+            try:
+                yield
+            except BaseException:
+                self.cancel()
+                raise
+
+    def cancel(self):
+        """Stops routing at the next page boundary; PDFs already recorded stay usable."""
+        self.cancelled.set()
+
+    @property
+    def partial(self):
+        """True if the run was cancelled before every added upload was routed."""
+        return self.cancelled.is_set() and len(self.routed) < len(self.sources)
+
+    def process(self, upload, page_mode, on_page=None):
+        """Spools, routes and records one upload. Returns the routing result."""
+        source = self.add_upload(upload)
+        result = self.route(source, page_mode, on_page=on_page)
+        self.add_result(source, result)
+        return result
+
+    def find_duplicates(self, suppress=False):
+        """
+        Maps every page that repeats an earlier page (in upload order) to the first copy,
+        once all uploads are routed. With suppress=True, repeated pages are also dropped
+        from the unit PDFs, and the annotation counts are reduced to match.
+        """
+        first_copy = {}
+        self.duplicates = {}
+        for key in sorted(self.page_hashes):
+            fingerprint = self.page_hashes[key]
+            if fingerprint in first_copy:
+                self.duplicates[key] = first_copy[fingerprint]
+            else:
+                first_copy[fingerprint] = key
+
+        if suppress and self.duplicates:
+            profile = self.master.profile
+            for unit, pages in self.unit_pages.items():
+                unit_set = set(pages)
+                kept = []
+                for key in sorted(pages):
+                    if self.duplicates.get(key) in unit_set:
+                        _, _, h, m = plan_unit_page(self.analyses[key], unit, profile, self.mode)
+                        self.highlight -= h
+                        self.mask -= m
+                    else:
+                        kept.append(key)
+                self.unit_pages[unit] = kept
+            self._unit_zips = {}
+            self._master_zip = None
+            self._unit_states = None
+            if self.pipeline is not None:
+                self.pipeline.reset()
+        return self.duplicates
+
+    def duplicate_report(self):
+        """One line per upload that repeats pages of earlier uploads."""
+        lines = []
+        for source, name in enumerate(self.names):
+            total = sum(1 for key in self.page_hashes if key[0] == source)
+            repeated = [key for key in self.duplicates if key[0] == source]
+            if not repeated:
+                continue
+            earlier = sorted({self.duplicates[key][0] for key in repeated})
+            earlier_names = ", ".join(self.names[s] for s in earlier)
+            if len(repeated) == total and len(earlier) == 1 and earlier[0] != source:
+                lines.append(f"{name} is a duplicate of {earlier_names} ({total} pages).")
+            else:
+                lines.append(f"{name}: {len(repeated)} of {total} pages repeat pages of {earlier_names}.")
+        return lines
+
+    def out_of_period_report(self):
+        """One line per upload with pages skipped by the period filter."""
+        skipped = {}
+        for source, pno in self.out_of_period:
+            skipped.setdefault(source, []).append(pno + 1)
+        return [
+            f"{self.names[source]}: skipped {len(pages)} page(s) dated outside the selected month "
+            f"({', '.join(map(str, sorted(pages)))})."
+            for source, pages in sorted(skipped.items())
+        ]
+
+    def output_units(self):
+        """Units that have pages and at least one matched ID, in master order."""
+        return [unit for unit in self.master.units if self.unit_pages.get(unit) and self.matched[unit]]
+
+    def unit_states(self):
+        """
+        {unit: {"signature", "content", "matched", "pages"}} of the output units, as
+        compared and stored by run_history. The signature covers what the unit's reports
+        are built from (matched IDs, master rows, profile, mode), the content signature
+        adds the fingerprints and annotations of its pages; "pages" is the page count.
+        """
+        if self._unit_states is None:
+            profile = self.master.profile
+            states = {}
+            for unit in self.output_units():
+                digest = hashlib.sha256(repr((profile.name, PROFILES.get(profile.name), self.mode)).encode())
+                digest.update(repr(sorted(self.matched[unit])).encode())
+                digest.update(pd.util.hash_pandas_object(self.master.unit_rows(unit), index=False).values.tobytes())
+                signature = digest.hexdigest()
+                pages = sorted(self.unit_pages[unit])
+                for key in pages:
+                    annotations, _, _, _ = plan_unit_page(self.analyses[key], unit, profile, self.mode)
+                    digest.update(repr((self.page_hashes.get(key), annotations)).encode())
+                states[unit] = {
+                    "signature": signature,
+                    "content": digest.hexdigest(),
+                    "matched": sorted(self.matched[unit]),
+                    "pages": len(pages),
+                }
+            self._unit_states = states
+        return self._unit_states
+
+    def changes(self):
+        """Per-unit changes against the previous run (diff mode), see run_history.RunHistory.diff."""
+        return self.history.diff(self.unit_states()) if self.history is not None else []
+
+    def changed_units(self):
+        """Output units whose ZIP has to be built; in diff mode, unchanged units are reused."""
+        if self.history is None:
+            return self.output_units()
+        states = self.unit_states()
+        return [unit for unit in self.output_units() if not self.history.has_zip(states[unit]["content"])]
+
+    def _stored_zip(self, unit):
+        if self.history is None:
+            return None
+        return self.history.stored_zip(self.unit_states()[unit]["content"])
+
+    def stored_reports(self, unit):
+        """The unit's Excel reports from the previous run if its matches are unchanged, or None."""
+        if self.history is None:
+            return None
+        return self.history.stored_reports(self.unit_states()[unit]["signature"])
+
+    def _store_zip(self, unit, zip_bytes):
+        if self.history is None:
+            return
+        state = self.unit_states()[unit]
+        self.history.store_zip(state["content"], zip_bytes)
+        profile = self.master.profile
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as unit_zip:
+            self.history.store_reports(
+                state["signature"],
+                unit_zip.read(profile.file_name("matched", unit)),
+                unit_zip.read(profile.file_name("unmatched", unit)),
+            )
+
+    def _extra_files(self):
+        """Files added to the ZIP of all units: the change summary in diff mode."""
+        return {CHANGES_FILE: changes_csv(self.changes())} if self.history is not None else {}
+
+    def _commit_history(self):
+        if self.history is not None:
+            self.history.commit(self.unit_states())
+
+    def render_unit_pdf(self, unit, only_source=None):
+        """
+        Builds the unit's final PDF in one pass: each run of consecutive pages of a
+        source is appended with a single insert_pdf call (shared fonts and images are
+        copied once per run instead of once per page), then every page is annotated in
+        place and the document is serialised once. With `only_source`, only the unit's
+        pages of that source are rendered (a partial PDF, see watch_folder.py).
+        """
+        profile = self.master.profile
+        pages = self.unit_pages.get(unit, [])
+        if only_source is not None:
+            pages = [key for key in pages if key[0] == only_source]
+        out = fitz.open()
+        docs = {}
+        start = time.perf_counter()
+        try:
+            for source, first, last in page_ranges(pages):
+                if source not in docs:
+                    docs[source] = fitz.open(self.sources[source])
+                first_page = out.page_count
+                out.insert_pdf(docs[source], from_page=first, to_page=last)
+                for offset, pno in enumerate(range(first, last + 1)):
+                    annotations, _, _, _ = plan_unit_page(self.analyses[(source, pno)], unit, profile, self.mode)
+                    apply_annotations(out[first_page + offset], annotations)
+            return out.tobytes()
+        finally:
+            for doc in docs.values():
+                doc.close()
+            out.close()
+            ops_metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="render", section=profile.name)
+
+    def unit_zip_name(self, unit):
+        return self.master.profile.file_name("folder", unit)
+
+    def _build_unit_zip(self, unit):
+        zip_bytes = self._stored_zip(unit)
+        if zip_bytes is None:
+            if self.pipeline is not None:
+                zip_bytes = self.pipeline.unit_zip(unit)
+            else:
+                zip_bytes = build_unit_zip(
+                    self.master, unit, self.render_unit_pdf(unit), self.matched[unit], self.stored_reports(unit)
+                )
+            self._store_zip(unit, zip_bytes)
+        ops_metrics.OUTPUT_BYTES.inc(len(zip_bytes), section=self.master.profile.name, kind="unit_zip")
+        return zip_bytes
+
+    def _iter_unit_zips(self, units, cancel=None):
+        """
+        (unit, ZIP bytes) in order; with a pipeline, the units not built yet are built in
+        parallel. Once `cancel` is set, RunCancelled is raised before the next unit.
+        """
+        if self.pipeline is None:
+            for unit in units:
+                if cancel is not None and cancel.is_set():
+                    raise RunCancelled()
+                yield unit, self._unit_zips.get(unit) or self._build_unit_zip(unit)
+            return
+        changed = set(self.changed_units())
+        built = self.pipeline.unit_zips(
+            [unit for unit in units if unit not in self._unit_zips and unit in changed], cancel=cancel
+        )
+        for unit in units:
+            if cancel is not None and cancel.is_set():
+                raise RunCancelled()
+            if unit in self._unit_zips:
+                yield unit, self._unit_zips[unit]
+            elif unit not in changed:
+                yield unit, self._build_unit_zip(unit)
+            else:
+                _, zip_bytes = next(built)
+                self._store_zip(unit, zip_bytes)
+                ops_metrics.OUTPUT_BYTES.inc(len(zip_bytes), section=self.master.profile.name, kind="unit_zip")
+                yield unit, zip_bytes
+
+    def unit_zip(self, unit):
+        if unit not in self._unit_zips:
+            self._unit_zips[unit] = self._build_unit_zip(unit)
+        return self._unit_zips[unit]
+
+    def write_master_zip(self, target, cancellable=True):
+        """
+        Writes the ZIP of all units to a path or binary file, one unit at a time, so
+        only one unit's output is held in memory (unit ZIPs already built are reused).
+        If the run is cancelled meanwhile (and `cancellable`), RunCancelled is raised at
+        the next unit; the ZIP is still closed and holds the units written so far.
+        """
+        cancel = self.cancelled if cancellable else None
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as master_zip:
+            for unit, zip_bytes in self._iter_unit_zips(self.output_units(), cancel):
+                master_zip.writestr(self.unit_zip_name(unit), zip_bytes)
+            for name, data in self._extra_files().items():
+                master_zip.writestr(name, data)
+        self._commit_history()
+        if isinstance(target, (str, os.PathLike)):
+            ops_metrics.OUTPUT_BYTES.inc(os.path.getsize(target), section=self.master.profile.name, kind="master_zip")
+
+    def master_zip(self):
+        if self._master_zip is None:
+            self._unit_zips.update(self._iter_unit_zips(self.output_units()))
+            self._master_zip = build_master_zip(
+                self.master, {unit: self._unit_zips[unit] for unit in self.output_units()}, self._extra_files()
+            )
+            self._commit_history()
+            ops_metrics.OUTPUT_BYTES.inc(len(self._master_zip), section=self.master.profile.name, kind="master_zip")
+        return self._master_zip
+
+    def close(self):
+        if self.pipeline is not None:
+            self.pipeline.close()
+        self.spool.cleanup()
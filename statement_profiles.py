@@ -0,0 +1,161 @@
+"""
+Declarative layout profiles for the statement types.
+
+Each profile describes how one statement layout is read and annotated; the shared
+processing core in statement_engine.py executes any profile. Adding a statement type
+(LWF, PT, ...) means adding an entry to PROFILES, not another section module:
+
+  id_column     master Excel column holding the IDs printed on the statement
+  id_pattern    regex a token must fully match to be treated as an ID candidate
+  highlight     "word": the ID word box grown by `offsets` (dx0, dy0, dx1, dy1)
+                "row":  every word within `row_tolerance` points vertically of the ID
+  mask          "candidates": hide every ID candidate that belongs to another unit
+                "rows":       hide every body row that is not highlighted
+  matched_fill  fill colour of matched IDs in mask mode (white reveals, yellow highlights)
+  header_band   fraction of the page height treated as header ({"first": .., "other": ..})
+  footer_band   fraction of the page height below which rows are footer
+  always_keep   pages kept in "relevant pages" mode even without a match ("first", "last")
+  unit_label    style for annotating the unit name on each page, or None
+  extraction    how page words are extracted: "band" (top, bottom) fractions of the unrotated
+                page height outside which text is skipped (None for the whole page), "flags"
+                the PyMuPDF TEXT_* flags.
+                The band keeps the header, where statement dates are read. It only limits
+                ID and date matching: unit names are located on the whole page.
+  files         output file names, formatted with the unit name
+  sheet_names   sheet names for the matched/unmatched reports, or None for the default
+"""
+import re
+
+import fitz  # PyMuPDF
+
+PROFILES = {
+    "PF": {
+        "id_column": "UAN",
+        "id_pattern": r"\b\d{12,15}\b",
+        "highlight": {"kind": "word", "offsets": (-5, -718, 5, 38)},
+        "mask": "candidates",
+        "matched_fill": (1, 1, 1),
+        "header_band": None,
+        "footer_band": None,
+        "always_keep": ("first", "last"),
+        "unit_label": None,
+        "extraction": {"band": (0.0, 0.96), "flags": ("TEXT_MEDIABOX_CLIP",)},
+        "files": {
+            "pdf": "{unit}_Processed.pdf",
+            "matched": "{unit}_Match.xlsx",
+            "unmatched": "{unit}_Unmatch.xlsx",
+            "folder": "{unit}_Processed.zip",
+        },
+        "sheet_names": None,
+    },
+    "ESIC": {
+        "id_column": "ESINO",
+        "id_pattern": r"\b\d{10,12}\b",
+        "highlight": {"kind": "word", "offsets": (-96, -5, 457, 5)},
+        "mask": "candidates",
+        "matched_fill": (1, 1, 1),
+        "header_band": None,
+        "footer_band": None,
+        "always_keep": ("first", "last"),
+        "unit_label": {"color": (0, 0, 1), "opacity": 0.3, "readonly": False, "counted": False},
+        "extraction": {"band": (0.0, 0.96), "flags": ("TEXT_MEDIABOX_CLIP",)},
+        "files": {
+            "pdf": "{unit}_ESINO.pdf",
+            "matched": "{unit}_Matched.xlsx",
+            "unmatched": "{unit}_Unmatched.xlsx",
+            "folder": "{unit}_Folder.zip",
+        },
+        "sheet_names": None,
+    },
+    "BANK": {
+        "id_column": "BANK_ACC_NO",
+        "id_pattern": r"\b\d+\b",
+        "highlight": {"kind": "row", "row_tolerance": 10},
+        "mask": "rows",
+        "matched_fill": (1, 1, 0),
+        "header_band": {"first": 0.30, "other": 0.12},
+        "footer_band": 0.95,
+        "always_keep": ("last",),
+        "unit_label": {"color": (1, 1, 0), "opacity": 0.5, "readonly": True, "counted": True},
+        # Full page: account rows can sit inside the footer band on bank statements.
+        "extraction": {"band": None, "flags": ("TEXT_MEDIABOX_CLIP",)},
+        "files": {
+            "pdf": "{unit}_Bank.pdf",
+            "matched": "{unit}_Matched.xlsx",
+            "unmatched": "{unit}_Unmatched.xlsx",
+            "folder": "{unit}_Folder.zip",
+        },
+        "sheet_names": ("Matched", "Unmatched"),
+    },
+}
+
+
+class StatementProfile:
+    """A layout profile compiled once: regex compiled, geometry and bands unpacked."""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.id_column = spec["id_column"]
+        self.id_regex = re.compile(spec["id_pattern"])
+        self.highlight_kind = spec["highlight"]["kind"]
+        self.offsets = spec["highlight"].get("offsets", (0, 0, 0, 0))
+        self.row_tolerance = spec["highlight"].get("row_tolerance", 0)
+        self.mask_kind = spec["mask"]
+        self.matched_fill = spec["matched_fill"]
+        self.header_band = spec["header_band"]
+        self.footer_band = spec["footer_band"]
+        self.always_keep = tuple(spec["always_keep"])
+        self.unit_label = spec["unit_label"]
+        self.text_band = spec["extraction"]["band"]
+        self.text_flags = 0
+        for flag in spec["extraction"]["flags"]:
+            self.text_flags |= getattr(fitz, flag)
+        self.files = dict(spec["files"])
+        self.sheet_names = spec["sheet_names"]
+
+    def keeps_page(self, page_number, total_pages):
+        """True if the page is kept in "relevant pages" mode regardless of matches."""
+        return ("first" in self.always_keep and page_number == 0) or (
+            "last" in self.always_keep and page_number == total_pages - 1
+        )
+
+    def header_limit(self, page_number, page_height):
+        if not self.header_band:
+            return None
+        band = self.header_band["first"] if page_number == 0 else self.header_band["other"]
+        return page_height * band
+
+    def footer_limit(self, page_height):
+        if not self.footer_band:
+            return None
+        return page_height * self.footer_band
+
+    def text_clip(self, page):
+        """
+        The part of the page words are extracted from, or None for the whole page. Like
+        get_text() words, the clip is in unrotated page space: on a /Rotate 90 page the
+        band runs along the unrotated height, not the displayed one.
+        """
+        if not self.text_band:
+            return None
+        top, bottom = self.text_band
+        area = unrotated_rect(page)
+        return fitz.Rect(area.x0, area.height * top, area.x1, area.height * bottom)
+
+    def file_name(self, kind, unit):
+        return self.files[kind].format(unit=unit)
+
+
+def unrotated_rect(page):
+    """The page rectangle in the unrotated space of get_text() coordinates."""
+    return page.rect * page.derotation_matrix
+
+
+_compiled = {}
+
+
+def get_profile(name):
+    """Returns the compiled profile for a statement type, compiling it on first use."""
+    if name not in _compiled:
+        _compiled[name] = StatementProfile(name, PROFILES[name])
+    return _compiled[name]
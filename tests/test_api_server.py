@@ -0,0 +1,81 @@
+"""The statement API: response headers and serving a job's output."""
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+from urllib.parse import unquote
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+import api_server
+from api_server import _content_disposition
+
+
+@pytest.mark.parametrize("name, fallback", [
+    ("jan-2025.zip", "jan-2025.zip"),
+    ('a"b.zip', "a_b.zip"),
+    ("x\r\nSet-Cookie: s=1.zip", "x__Set-Cookie_ s_1.zip"),
+    ("Unité 7_Folder.zip", "Unit_ 7_Folder.zip"),
+])
+def test_content_disposition_escapes_the_name(name, fallback):
+    value = _content_disposition(name)
+    plain, extended = value.split("; filename*=UTF-8''")
+    assert plain == f'attachment; filename="{fallback}"'
+    assert all(c.isascii() and c.isprintable() and c not in "\";" for c in extended)
+    assert unquote(extended) == name
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, "CHECKPOINTS_ENABLED", False)
+    server = api_server.make_server("127.0.0.1", 0, api_server.JobManager(root=str(tmp_path / "jobs")))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _request(url, method="GET", payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.headers, response.read()
+
+
+def test_unit_zip_is_served_from_the_result(api, tmp_path):
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({"UNIT": ["A/B", "C"], "UAN": ["100000000001", "100000000002"]}).to_excel(master_path, index=False)
+    pdf_path = tmp_path / "pf.pdf"
+    doc = fitz.open()
+    for uan in ("100000000001", "100000000002"):
+        doc.new_page().insert_text((60, 120), f"1 {uan} NAME 1500.00")
+    doc.save(pdf_path)
+    doc.close()
+
+    _, body = _request(f"{api}/jobs", "POST", {"type": "PF", "master": str(master_path), "pdfs": [str(pdf_path)]})
+    job_id = json.loads(body)["id"]
+    deadline = time.time() + 30
+    while True:
+        status = json.loads(_request(f"{api}/jobs/{job_id}")[1])
+        if status["state"] not in ("queued", "running") or time.time() > deadline:
+            break
+        time.sleep(0.05)
+    assert status["state"] == "done" and sorted(status["units"]) == ["A/B", "C"]
+
+    headers, unit_zip = _request(f"{api}/jobs/{job_id}/units/{urllib.parse.quote('A/B', safe='')}")
+    assert int(headers["Content-Length"]) == len(unit_zip)
+    _, result = _request(f"{api}/jobs/{job_id}/result")
+    with zipfile.ZipFile(io.BytesIO(result)) as archive:
+        assert archive.read("A/B_Processed.zip") == unit_zip
+
+    _request(f"{api}/jobs/{job_id}", "DELETE")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _request(f"{api}/jobs/{job_id}/units/C")
+    assert error.value.code == 404
@@ -0,0 +1,94 @@
+"""Cancelling a run: routing stops, the PDF is closed and the routed part stays usable."""
+import zipfile
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+import statement_engine
+from statement_engine import MODE_HIGHLIGHT, PAGES_RELEVANT, RunCancelled, StatementRun, load_master, route_pdf
+from statement_profiles import get_profile
+
+UANS = [str(100000000000 + i) for i in range(4)]
+
+
+@pytest.fixture
+def pf_run(tmp_path):
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({"UNIT": [f"UNIT {i}" for i in range(len(UANS))], "UAN": UANS}).to_excel(master_path, index=False)
+    pdf_paths = []
+    for name, uans in (("first.pdf", UANS[:2]), ("second.pdf", UANS[2:])):
+        doc = fitz.open()
+        for uan in uans:
+            doc.new_page().insert_text((60, 120), f"1 {uan} NAME 1500.00")
+        doc.save(tmp_path / name)
+        doc.close()
+        pdf_paths.append(str(tmp_path / name))
+
+    run = StatementRun(load_master(str(master_path), get_profile("PF")), MODE_HIGHLIGHT)
+    yield run, pdf_paths
+    run.close()
+
+
+def test_route_pdf_closes_the_pdf_when_on_page_raises(pf_run, monkeypatch):
+    run, pdf_paths = pf_run
+    opened = []
+
+    def open_pdf(pdf_file):
+        opened.append(fitz.open(pdf_file))
+        return opened[-1]
+
+    def on_page(pno, total):
+        raise KeyboardInterrupt  # how Streamlit stops a script on Cancel
+
+    monkeypatch.setattr(statement_engine, "open_pdf", open_pdf)
+    with pytest.raises(KeyboardInterrupt):
+        route_pdf(pdf_paths[0], run.master, MODE_HIGHLIGHT, PAGES_RELEVANT, on_page=on_page)
+    assert opened[0].is_closed
+
+
+def test_cancel_stops_routing_at_the_next_page(pf_run):
+    run, pdf_paths = pf_run
+    seen = []
+
+    def on_page(pno, total):
+        seen.append(pno)
+        run.cancel()
+
+    with pytest.raises(RunCancelled):
+        run.process(pdf_paths[0], PAGES_RELEVANT, on_page=on_page)
+    assert seen == [0]
+    assert run.partial
+    with pytest.raises(RunCancelled):
+        run.process(pdf_paths[1], PAGES_RELEVANT)
+
+
+def test_partial_output_keeps_the_routed_pdfs(pf_run, tmp_path):
+    run, pdf_paths = pf_run
+    run.process(pdf_paths[0], PAGES_RELEVANT)
+    run.cancel()
+    with pytest.raises(RunCancelled):
+        run.process(pdf_paths[1], PAGES_RELEVANT)
+    assert run.partial
+
+    with pytest.raises(RunCancelled):
+        run.write_master_zip(str(tmp_path / "cancelled.zip"))
+
+    # What the API does for a job cancelled with keep_partial.
+    run.write_master_zip(str(tmp_path / "partial.zip"), cancellable=False)
+    with zipfile.ZipFile(tmp_path / "partial.zip") as archive:
+        names = set(archive.namelist())
+    assert {run.unit_zip_name("UNIT 0"), run.unit_zip_name("UNIT 1")} <= names
+    assert not names & {run.unit_zip_name("UNIT 2"), run.unit_zip_name("UNIT 3")}
+
+
+def test_processing_cancels_the_run_when_left_by_any_exception(pf_run):
+    run, _ = pf_run
+    with run.processing():
+        pass
+    assert not run.cancelled.is_set()
+
+    with pytest.raises(KeyboardInterrupt):
+        with run.processing():
+            raise KeyboardInterrupt
+    assert run.cancelled.is_set()
@@ -0,0 +1,93 @@
+"""Tolerant lookup of statement tokens in the packed ID index."""
+import io
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+from id_index import PackedIdIndex, candidate_tokens
+from statement_engine import MODE_HIGHLIGHT, PAGES_RELEVANT, StatementRun, load_master, load_masters, unit_reports
+from statement_profiles import get_profile
+
+UNITS = {
+    "ALPHA": ["100000000001", "0012345678", "012345"],
+    "BETA": ["100000000002", "200000000002", "12345"],
+    "GAMMA": ["300000007777", "100000000001"],
+}
+
+
+@pytest.fixture
+def index():
+    return PackedIdIndex.from_ids(UNITS)
+
+
+@pytest.mark.parametrize("token, hits", [
+    ("100000000001", {"ALPHA": ("100000000001",), "GAMMA": ("100000000001",)}),
+    ("12345678", {"ALPHA": ("0012345678",)}),                  # master ID has leading zeros
+    ("000100000000002", {"BETA": ("100000000002",)}),          # statement pads the number
+    ("1000-0000-0002", {"BETA": ("100000000002",)}),
+    ("XXXXXXXX7777", {"GAMMA": ("300000007777",)}),           # suffix of exactly one ID
+    ("****7777", {"GAMMA": ("300000007777",)}),
+    ("XXXXXXXX0002", {}),                                      # two IDs end in 0002
+    ("XXXXXXXXX777", {}),                                      # suffix shorter than min_suffix
+    ("999999999999", {}),
+])
+def test_lookup(index, token, hits):
+    assert index.lookup(token) == hits
+    assert index.lookup_many([token]) == [hits]
+
+
+def test_unit_keeps_every_matching_id(index):
+    # "012345" and "12345" are different master rows of the same number.
+    assert index.lookup("12345") == {"ALPHA": ("012345",), "BETA": ("12345",)}
+    both = PackedIdIndex.from_ids({"ALPHA": ["012345", "12345", "12345"]})
+    assert both.lookup("0012345") == {"ALPHA": ("012345", "12345")}
+
+
+def test_saved_index_resolves_the_same(index, tmp_path):
+    index.save(tmp_path)
+    loaded = PackedIdIndex.load(tmp_path, list(UNITS))
+    for token in ("100000000001", "12345678", "XXXXXXXX7777", "XXXXXXXX0002"):
+        assert loaded.lookup(token) == index.lookup(token)
+
+
+def test_grouped_digits_merge_into_one_token(index):
+    words = [(10, 0, 30, 10, "1000", 0, 0, 0), (32, 0, 52, 10, "0000", 0, 0, 1), (54, 0, 74, 10, "0002", 0, 0, 2)]
+    merged = candidate_tokens(words, index)[-1]
+    assert merged[:5] == (10, 0, 74, 10, "100000000002")
+
+
+def test_reports_keep_the_master_ids_as_written(tmp_path):
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({
+        "UNIT": ["ALPHA", "ALPHA", "ALPHA"],
+        "UAN": ["1000-0000-0001", "0000 1234 5678", "100000000003"],
+    }).to_excel(master_path, index=False)
+    pdf_path = tmp_path / "pf.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((60, 120), "1 100000000001 2 000012345678")
+    doc.save(pdf_path)
+    doc.close()
+
+    run = StatementRun(load_master(str(master_path), get_profile("PF")), MODE_HIGHLIGHT)
+    try:
+        run.process(str(pdf_path), PAGES_RELEVANT)
+        assert run.matched["ALPHA"] == {"1000-0000-0001", "0000 1234 5678"}
+        matched, unmatched = unit_reports(run.master, "ALPHA", run.matched["ALPHA"])
+    finally:
+        run.close()
+    assert pd.read_excel(io.BytesIO(matched), dtype=str)["UAN"].tolist() == ["1000-0000-0001", "0000 1234 5678"]
+    assert pd.read_excel(io.BytesIO(unmatched), dtype=str)["UAN"].tolist() == ["100000000003"]
+
+
+def test_combined_master_drops_rows_without_an_id(tmp_path):
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({
+        "UNIT": ["ALPHA", "BETA"],
+        "UAN": ["1000-0000-0001", " "],
+        "ESINO": [None, "12345 67890"],
+    }).to_excel(master_path, index=False)
+    masters = load_masters(str(master_path), [get_profile("PF"), get_profile("ESIC")])
+    assert masters["PF"].df["UAN"].tolist() == ["1000-0000-0001"]
+    assert masters["ESIC"].df["ESINO"].tolist() == ["12345 67890"]
+    assert masters["ESIC"].index.lookup("1234567890") == {"BETA": ("12345 67890",)}
@@ -0,0 +1,29 @@
+"""The on-disk OCR cache."""
+import os
+import stat
+
+import pytest
+
+import ocr_fallback
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "ocr_cache"
+    monkeypatch.setattr(ocr_fallback, "OCR_CACHE_DIR", str(directory))
+    monkeypatch.setattr(ocr_fallback, "_cache_ready", False)
+    return directory
+
+
+def test_cache_round_trip(cache_dir):
+    words = [(1.0, 2.0, 3.0, 4.0, "100000000001", 0, 0, 0)]
+    assert ocr_fallback._read_cache("abc") is None
+    ocr_fallback._write_cache("abc", words)
+    assert ocr_fallback._read_cache("abc") == words
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_cache_directory_is_private(cache_dir):
+    cache_dir.mkdir(mode=0o755)
+    ocr_fallback._write_cache("abc", [])
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
@@ -0,0 +1,74 @@
+"""The Prometheus text rendering and the gauges the engine keeps."""
+import pytest
+
+import ops_metrics
+from ops_metrics import Metric
+
+
+def _samples(text, name):
+    """{line without value: value} of the sample lines of `name` in rendered text."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith(name) and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    metric = Metric("test_seconds", "histogram", "Test.", (0.1, 1, 10))
+    for value in (0.05, 0.1, 0.5, 1, 5, 50):
+        metric.observe(value, stage="x")
+    lines = metric.render()
+    assert lines[:2] == ["# HELP test_seconds Test.", "# TYPE test_seconds histogram"]
+    samples = _samples("\n".join(lines), "test_seconds")
+    assert samples == {
+        'test_seconds_bucket{stage="x",le="0.1"}': 2,  # a value on a bound is in that bucket
+        'test_seconds_bucket{stage="x",le="1"}': 4,
+        'test_seconds_bucket{stage="x",le="10"}': 5,
+        'test_seconds_bucket{stage="x",le="+Inf"}': 6,
+        'test_seconds_sum{stage="x"}': pytest.approx(56.65),
+        'test_seconds_count{stage="x"}': 6,
+    }
+
+
+def test_inf_bucket_equals_count_in_every_series():
+    ops_metrics.STAGE_SECONDS.observe(1000, stage="test_inf", section="T")
+    ops_metrics.STAGE_SECONDS.observe(0.001, stage="test_inf", section="T")
+    text = ops_metrics.render()
+    samples = _samples(text, "statement_stage_seconds")
+    counts = {series: value for series, value in samples.items() if "_count" in series}
+    assert counts
+    for series, count in counts.items():
+        labels = series[len("statement_stage_seconds_count{"):-1]
+        assert samples[f'statement_stage_seconds_bucket{{{labels},le="+Inf"}}'] == count
+    assert samples['statement_stage_seconds_count{section="T",stage="test_inf"}'] == 2
+    assert samples['statement_stage_seconds_bucket{section="T",stage="test_inf",le="600"}'] == 1
+
+
+def test_label_values_are_escaped():
+    metric = Metric("test_total", "counter", "Test.")
+    metric.inc(section='a "quoted" \\ path\nline')
+    assert metric.render()[-1] == 'test_total{section="a \\"quoted\\" \\\\ path\\nline"} 1'
+    assert Metric("test_plain", "gauge", "Test.").render() == ["# HELP test_plain Test.", "# TYPE test_plain gauge"]
+
+
+def _gauge(metric, **labels):
+    return metric.values.get(metric._key(labels), 0)
+
+
+def test_gauges_return_to_zero_after_an_exception():
+    with pytest.raises(RuntimeError):
+        with ops_metrics.track_run("TEST_TRACK", lambda: 10):
+            assert _gauge(ops_metrics.ACTIVE_RUNS, section="TEST_TRACK") == 1
+            raise RuntimeError
+    assert _gauge(ops_metrics.ACTIVE_RUNS, section="TEST_TRACK") == 0
+    assert 'statement_run_seconds_count{section="TEST_TRACK"} 1' in ops_metrics.render()
+
+    with pytest.raises(KeyboardInterrupt):
+        with ops_metrics.busy("test_pool", capacity=4):
+            with ops_metrics.busy("test_pool"):
+                assert _gauge(ops_metrics.WORKERS_BUSY, pool="test_pool") == 2
+                raise KeyboardInterrupt
+    assert _gauge(ops_metrics.WORKERS_BUSY, pool="test_pool") == 0
+    assert _gauge(ops_metrics.WORKERS_CAPACITY, pool="test_pool") == 4
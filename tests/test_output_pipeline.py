@@ -0,0 +1,102 @@
+"""Scheduling of the output pipeline's render tasks."""
+import io
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+from output_pipeline import OutputPipeline
+from statement_engine import MODE_HIGHLIGHT, PAGES_RELEVANT, StatementRun, load_master
+from statement_profiles import get_profile
+
+UNITS = 24
+
+
+@pytest.fixture
+def pf_run(tmp_path):
+    uans = [str(100000000000 + i) for i in range(UNITS)]
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({"UNIT": [f"UNIT {i:02d}" for i in range(UNITS)], "UAN": uans}).to_excel(master_path, index=False)
+    pdf_path = tmp_path / "pf.pdf"
+    doc = fitz.open()
+    for uan in uans:
+        doc.new_page().insert_text((60, 120), f"1 {uan} NAME 1500.00")
+    doc.save(pdf_path)
+    doc.close()
+
+    run = StatementRun(load_master(str(master_path), get_profile("PF")), MODE_HIGHLIGHT)
+    yield run, str(pdf_path)
+    run.close()
+
+
+class GatedPool:
+    """A one-thread pool that records what it is given; the first task waits for `gate`."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.gate = threading.Event()
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn.__name__, args))
+        if len(self.submitted) == 1:
+            return self.executor.submit(self._gated, fn, *args)
+        return self.executor.submit(fn, *args)
+
+    def _gated(self, fn, *args):
+        self.gate.wait(10)
+        return fn(*args)
+
+
+def _unit_pdf_text(zip_bytes, name):
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as unit_zip:
+        with fitz.open(stream=unit_zip.read(name), filetype="pdf") as doc:
+            return [page.get_text() for page in doc]
+
+
+def test_single_unit_does_not_wait_for_queued_units(pf_run):
+    run, pdf_path = pf_run
+    pool = GatedPool()
+    pipeline = OutputPipeline(run, pool=pool, render_early=True, max_running=1)
+    try:
+        run.process(pdf_path, PAGES_RELEVANT)
+        # Stage 2 has queued a partial for every unit; only the first reached the pool.
+        assert len(pool.submitted) == 1
+
+        unit = run.output_units()[-1]
+        future = pipeline.unit_future(unit)
+        assert not future.done()
+        pool.gate.set()
+        zip_bytes = future.result(timeout=30)
+
+        texts = _unit_pdf_text(zip_bytes, f"{unit}_Processed.pdf")
+        # PF always keeps the first page; the unit's own page is the last.
+        assert len(texts) == 2 and str(100000000000 + UNITS - 1) in texts[1]
+        # The unit went right after the task already in flight: its partial and its
+        # reports side by side, then its ZIP.
+        names = [name for name, _ in pool.submitted]
+        assert names[:4] == ["_render_partial", "_render_partial", "_build_reports", "_finish_unit"]
+        assert [pno for pno, _ in pool.submitted[1][1][1]] == [0, UNITS - 1]
+    finally:
+        pipeline.close()
+        pool.executor.shutdown()
+
+
+def test_units_render_only_when_asked_for(pf_run):
+    run, pdf_path = pf_run
+    pool = GatedPool()
+    pool.gate.set()
+    pipeline = OutputPipeline(run, pool=pool)
+    try:
+        run.process(pdf_path, PAGES_RELEVANT)
+        assert pool.submitted == []
+
+        unit = run.output_units()[0]
+        assert _unit_pdf_text(run.unit_zip(unit), f"{unit}_Processed.pdf")
+        assert [name for name, _ in pool.submitted] == ["_render_partial", "_build_reports", "_finish_unit"]
+    finally:
+        pipeline.close()
+        pool.executor.shutdown()
@@ -0,0 +1,48 @@
+"""Page fingerprints and the duplicate detection built on them."""
+import fitz  # PyMuPDF
+import pandas as pd
+
+from page_fingerprint import page_content_hash
+from statement_engine import MODE_HIGHLIGHT, PAGES_ALL, StatementRun, load_master
+from statement_profiles import get_profile
+
+UANS = ["100000000001", "100000000002", "100000000003"]
+
+
+def _form_pages(path, texts):
+    """A PDF whose pages show `texts` through Form XObjects: every content stream is "q /fzFrm0 Do Q"."""
+    src = fitz.open()
+    for text in texts:
+        src.new_page().insert_text((60, 120), text)
+    doc = fitz.open()
+    for pno in range(len(texts)):
+        page = doc.new_page()
+        page.show_pdf_page(page.rect, src, pno)
+    doc.save(path)
+    doc.close()
+    src.close()
+
+
+def test_pages_differing_only_inside_xobjects(tmp_path):
+    path = tmp_path / "forms.pdf"
+    _form_pages(path, ["1 100000000001 NAME", "1 100000000002 NAME", "1 100000000001 NAME"])
+    with fitz.open(path) as doc:
+        assert doc[0].read_contents() == doc[1].read_contents()
+        hashes = [page_content_hash(doc, page) for page in doc]
+    assert hashes[0] != hashes[1]
+    assert hashes[0] == hashes[2]
+
+
+def test_find_duplicates_with_form_pages(tmp_path):
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({"UNIT": ["ALPHA", "BETA", "GAMMA"], "UAN": UANS}).to_excel(master_path, index=False)
+    path = tmp_path / "forms.pdf"
+    _form_pages(path, [f"1 {uan} NAME 1500.00" for uan in UANS])
+
+    run = StatementRun(load_master(str(master_path), get_profile("PF")), MODE_HIGHLIGHT)
+    try:
+        run.process(str(path), PAGES_ALL)
+        assert run.find_duplicates() == {}
+        assert run.matched == {"ALPHA": {UANS[0]}, "BETA": {UANS[1]}, "GAMMA": {UANS[2]}}
+    finally:
+        run.close()
@@ -0,0 +1,65 @@
+"""Date detection and page decisions of the period filter."""
+import pytest
+
+from period_filter import PeriodFilter, page_periods, text_periods
+
+
+@pytest.mark.parametrize("text, periods", [
+    ("Jan 15, 2025", {(2025, 1)}),
+    ("Feb 28 2025", {(2025, 2)}),
+    ("Mar 3, 2025", {(2025, 3)}),
+    ("Sept 1st, 2024", {(2024, 9)}),
+    ("Statement for Jan 2025", {(2025, 1)}),
+    ("January, 2025", {(2025, 1)}),
+    ("15 Jan 2025", {(2025, 1)}),
+    ("Jan-2025", {(2025, 1)}),
+    ("Jan-25", {(2025, 1)}),
+    ("Jan'25", {(2025, 1)}),
+    ("Jan/25", {(2025, 1)}),
+    ("May 2025", {(2025, 5)}),
+    ("MAY-2025", {(2025, 5)}),
+    ("15/01/2025", {(2025, 1)}),
+    ("2025-01-15", {(2025, 1)}),
+    ("wage month 01/2025", {(2025, 1)}),
+])
+def test_date_shapes(text, periods):
+    assert text_periods(text) == periods
+
+
+@pytest.mark.parametrize("text", [
+    "Jan 25",  # a day, not a two-digit year
+    "Jan 45, 2025",
+    "you may 12 units",
+    "you may 2025",
+    "12 100123456789 MOHAMMAD JAN 2500 2500 300",  # wages after a name, not years
+    "3 100123456780 SUNITA MAY 1800 1800 216",
+    "31/12/1899",
+    "2501-01-15",
+])
+def test_not_dates(text):
+    assert text_periods(text) == set()
+
+
+def _words(text):
+    return [(0, 0, 0, 0, word) for word in text.split()]
+
+
+def test_page_dated_in_period_is_kept():
+    assert PeriodFilter((2025, 1)).keep(page_periods(_words("Jan 15, 2025 entries")))
+
+
+def test_undated_pages_follow_previous_page():
+    period_filter = PeriodFilter((2025, 1))
+    pages = ["Opening balance", "Jan 15, 2025 entries", "Totals", "Statement for Feb 2025", "Totals", "Jan 31, 2025"]
+    kept = [period_filter.keep(page_periods(_words(text))) for text in pages]
+    assert kept == [True, True, True, False, False, True]
+
+
+def test_wage_rows_do_not_date_a_page():
+    period_filter = PeriodFilter((2025, 1))
+    pages = [
+        "Wage month 01/2025",
+        "12 100123456789 MOHAMMAD JAN 2500 2500 300",
+        "3 100123456780 SUNITA MAY 1800 1800 216",
+    ]
+    assert [period_filter.keep(page_periods(_words(text))) for text in pages] == [True, True, True]
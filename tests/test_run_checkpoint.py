@@ -0,0 +1,92 @@
+"""Run checkpoints: resuming an interrupted run, workspace keys and permissions."""
+import os
+import stat
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+import statement_engine
+from run_checkpoint import RunCheckpoint, private_directory
+from statement_engine import (
+    MODE_HIGHLIGHT, MODE_MASK, PAGES_ALL, PAGES_RELEVANT, RunCancelled, StatementRun, load_master,
+)
+from statement_profiles import get_profile
+
+UANS = [str(100000000000 + i) for i in range(4)]
+
+
+@pytest.fixture
+def master(tmp_path):
+    master_path = tmp_path / "master.xlsx"
+    pd.DataFrame({"UNIT": [f"UNIT {i}" for i in range(len(UANS))], "UAN": UANS}).to_excel(master_path, index=False)
+    return load_master(str(master_path), get_profile("PF"))
+
+
+@pytest.fixture
+def pdf_paths(tmp_path):
+    paths = []
+    for name, uans in (("first.pdf", UANS[:2]), ("second.pdf", UANS[2:])):
+        doc = fitz.open()
+        for uan in uans:
+            doc.new_page().insert_text((60, 120), f"1 {uan} NAME 1500.00")
+        doc.save(tmp_path / name)
+        doc.close()
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def test_interrupted_run_resumes_from_its_shards(master, pdf_paths, tmp_path, monkeypatch):
+    root = str(tmp_path / "runs")
+    run = StatementRun(master, MODE_HIGHLIGHT, RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, root))
+    run.process(pdf_paths[0], PAGES_RELEVANT)
+    with pytest.raises(RunCancelled):
+        run.process(pdf_paths[1], PAGES_RELEVANT, on_page=lambda pno, total: run.cancel())
+    run.close()
+
+    routed = []
+    route_pdf = statement_engine.route_pdf
+
+    def counting_route_pdf(pdf_file, *args, **kwargs):
+        routed.append(pdf_file)
+        return route_pdf(pdf_file, *args, **kwargs)
+
+    monkeypatch.setattr(statement_engine, "route_pdf", counting_route_pdf)
+    checkpoint = RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, root)
+    assert checkpoint.completed() == 1
+    resumed = StatementRun(master, MODE_HIGHLIGHT, checkpoint)
+    try:
+        assert resumed.process(pdf_paths[0], PAGES_RELEVANT)["resumed"]
+        assert not resumed.process(pdf_paths[1], PAGES_RELEVANT)["resumed"]
+        assert len(routed) == 1  # only the PDF the interrupted run did not finish
+        assert checkpoint.completed() == 2
+        assert {unit: ids for unit, ids in resumed.matched.items() if ids} == {
+            f"UNIT {i}": {uan} for i, uan in enumerate(UANS)
+        }
+    finally:
+        resumed.close()
+
+
+def test_workspace_key_follows_the_run_settings(master, tmp_path):
+    root = str(tmp_path / "runs")
+    base = RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, root).directory
+    assert RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, root).directory == base
+    others = [
+        RunCheckpoint(master, MODE_MASK, PAGES_RELEVANT, root).directory,
+        RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_ALL, root).directory,
+        RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, root, period=(2024, 3)).directory,
+        RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, root, period=(2024, 4)).directory,
+    ]
+    assert len({base, *others}) == 5
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_directory_stays_private(master, tmp_path):
+    root = tmp_path / "runs"
+    RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, str(root))
+    assert stat.S_IMODE(os.stat(root).st_mode) == 0o700
+
+    os.chmod(root, 0o755)
+    RunCheckpoint(master, MODE_HIGHLIGHT, PAGES_RELEVANT, str(root))
+    assert stat.S_IMODE(os.stat(root).st_mode) == 0o700
+    assert private_directory(str(root)) == str(root)
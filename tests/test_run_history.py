@@ -0,0 +1,90 @@
+"""Diff mode against the stored previous run."""
+import io
+import os
+import stat
+import zipfile
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+from run_history import CHANGED, UNCHANGED, RunHistory
+from statement_engine import MODE_HIGHLIGHT, PAGES_RELEVANT, StatementRun, load_master
+from statement_profiles import get_profile
+
+UANS = ["100000000001", "100000000002"]
+
+
+@pytest.fixture
+def master(tmp_path):
+    path = tmp_path / "master.xlsx"
+    pd.DataFrame({"UNIT": ["ALPHA", "BETA"], "UAN": UANS}).to_excel(path, index=False)
+    return load_master(str(path), get_profile("PF"))
+
+
+def _statement(path, month, uans):
+    doc = fitz.open()
+    for uan in uans:
+        doc.new_page().insert_text((60, 120), f"{month} 2025 1 {uan} NAME 1500.00")
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def _run(master, history, pdf_path):
+    run = StatementRun(master, MODE_HIGHLIGHT)
+    run.history = history
+    run.process(pdf_path, PAGES_RELEVANT)
+    return run
+
+
+def _unit_pdf_text(master_zip, unit_zip_name, pdf_name):
+    with zipfile.ZipFile(io.BytesIO(master_zip)) as outer:
+        with zipfile.ZipFile(io.BytesIO(outer.read(unit_zip_name))) as inner:
+            with fitz.open(stream=inner.read(pdf_name), filetype="pdf") as doc:
+                return doc[0].get_text()
+
+
+def test_next_month_with_the_same_matches_is_unchanged(master, tmp_path):
+    root = tmp_path / "history"
+    jan = _run(master, RunHistory("PF", "client", root=str(root)), _statement(tmp_path / "jan.pdf", "Jan", UANS))
+    jan.master_zip()
+    jan.close()
+
+    feb = _run(master, RunHistory("PF", "client", root=str(root)), _statement(tmp_path / "feb.pdf", "Feb", UANS[:1]))
+    try:
+        assert {change["unit"]: change["status"] for change in feb.changes()}["ALPHA"] == UNCHANGED
+        assert feb.stored_reports("ALPHA") is not None
+        # The reports are reused, the PDF is still this month's.
+        assert "Feb 2025" in _unit_pdf_text(feb.master_zip(), feb.unit_zip_name("ALPHA"), "ALPHA_Processed.pdf")
+    finally:
+        feb.close()
+
+
+def test_changed_matches_are_reported(master, tmp_path):
+    root = tmp_path / "history"
+    jan = _run(master, RunHistory("PF", "client", root=str(root)), _statement(tmp_path / "jan.pdf", "Jan", UANS[:1]))
+    jan.master_zip()
+    jan.close()
+
+    # ALPHA gained an employee: its unmatched report differs.
+    path = tmp_path / "master_feb.xlsx"
+    pd.DataFrame({"UNIT": ["ALPHA", "ALPHA", "BETA"], "UAN": UANS[:1] + ["100000000003"] + UANS[1:]}).to_excel(
+        path, index=False
+    )
+    master = load_master(str(path), get_profile("PF"))
+    feb = _run(master, RunHistory("PF", "client", root=str(root)), _statement(tmp_path / "feb.pdf", "Feb", UANS[:1]))
+    try:
+        assert [change["status"] for change in feb.changes()] == [CHANGED]
+        assert feb.stored_reports("ALPHA") is None
+    finally:
+        feb.close()
+
+
+def test_histories_are_private_and_separate(tmp_path):
+    root = tmp_path / "history"
+    one = RunHistory("PF", "client one", root=str(root))
+    two = RunHistory("PF", "client two", root=str(root))
+    assert one.directory != two.directory
+    if hasattr(os, "getuid"):
+        assert stat.S_IMODE(os.stat(root).st_mode) == 0o700
@@ -0,0 +1,51 @@
+"""Text extraction settings of the layout profiles."""
+import io
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+from statement_engine import MODE_HIGHLIGHT, PAGES_ALL, MasterData, clip_words, extract_words, route_pdf
+from statement_profiles import get_profile
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_band_follows_unrotated_page(rotation):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    for y in (100, 400, 700, 800, 835):
+        page.insert_text((60, y), f"row{y}")
+    page.set_rotation(rotation)
+
+    profile = get_profile("PF")
+    assert profile.text_clip(page) == fitz.Rect(0, 0, 595, 842 * 0.96)
+    # The band ends at 808 pt of the unrotated height: only the last row is footer.
+    assert [w[4] for w in extract_words(page, profile)] == ["row100", "row400", "row700", "row800"]
+
+
+def test_ocr_words_get_the_same_band():
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    for y in (100, 800, 835):
+        page.insert_text((60, y), f"row{y}")
+    page.set_rotation(90)
+    # OCR returns the whole page, as get_text() does without a clip.
+    ocr_words = page.get_text("words")
+    profile = get_profile("ESIC")
+    assert [w[4] for w in clip_words(page, profile, ocr_words)] == ["row100", "row800"]
+    assert clip_words(page, get_profile("BANK"), ocr_words) == ocr_words
+
+
+def test_unit_names_are_found_outside_the_band():
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((60, 100), "1 1000000001 NAME")
+    # Below the band (808 pt): the unit name is still located, the ID is not matched.
+    page.insert_text((60, 835), "ACME WORKS 1000000002")
+    master = MasterData(
+        pd.DataFrame({"UNIT": ["ACME WORKS", "OTHER"], "ESINO": ["1000000001", "1000000002"]}), get_profile("ESIC")
+    )
+    result = route_pdf(io.BytesIO(doc.tobytes()), master, MODE_HIGHLIGHT, PAGES_ALL)
+    analysis = result["analyses"][0]
+    assert [rect.y1 for rect in analysis["unit_rects"]["ACME WORKS"]] == [pytest.approx(page.search_for("ACME")[0].y1)]
+    assert result["matched"] == {"ACME WORKS": {"1000000001"}, "OTHER": set()}
@@ -0,0 +1,53 @@
+"""The one-pass unit locator finds what page.search_for finds, where it finds it."""
+import fitz  # PyMuPDF
+import pytest
+
+from unit_locator import UnitMatcher, locate_units
+
+LINES = [
+    "UNIT: Acme   Steel Works Ltd",
+    "unit: ACME STEEL",
+    "Branch  ACME STEEL WORKS LTD (EAST)",
+    "NORTH ZONE",
+    "NORTH ZONE WEST",
+    "Employer ACME STEEL",
+    "WORKS LTD continued",
+]
+UNITS = [
+    "ACME STEEL WORKS LTD",  # multi-word, also wrapped over two lines
+    "acme  steel   works ltd",  # same name, other case and spacing
+    "ACME STEEL",  # prefix of another unit
+    "Steel Works",  # overlaps both of the above
+    "NORTH ZONE",
+    "NORTH ZONE WEST",
+    "STEEL WORK",  # ends inside a word
+    "SOUTH ZONE",  # not on the page
+]
+
+
+@pytest.fixture(scope="module")
+def page():
+    doc = fitz.open()
+    page = doc.new_page()
+    for i, line in enumerate(LINES):
+        page.insert_text((60, 100 + 20 * i), line)
+    yield page
+    doc.close()
+
+
+@pytest.mark.parametrize("unit", UNITS)
+def test_matches_search_for(page, unit):
+    found = locate_units(page.get_text("words"), UnitMatcher(UNITS))
+    expected = page.search_for(unit)
+    rects = found.get(unit, [])
+    assert len(rects) == len(expected)
+    for rect, want in zip(rects, expected):
+        # A match ending inside a word is cut proportionally, not at the glyph edge.
+        assert rect.y0 == pytest.approx(want.y0) and rect.y1 == pytest.approx(want.y1)
+        assert rect.x0 == pytest.approx(want.x0, abs=1.5) and rect.x1 == pytest.approx(want.x1, abs=1.5)
+
+
+def test_absent_units_are_left_out(page):
+    found = locate_units(page.get_text("words"), UnitMatcher(UNITS))
+    assert "SOUTH ZONE" not in found
+    assert locate_units([], UnitMatcher(UNITS)) == {}
@@ -0,0 +1,77 @@
+"""Incremental processing and month close of the watch-folder daemon."""
+import io
+import zipfile
+
+import fitz  # PyMuPDF
+import pandas as pd
+import pytest
+
+from statement_engine import PAGES_ALL, PAGES_RELEVANT
+from watch_folder import FolderWatcher, _partial_name
+
+UNITS = {"A/B": "100000000001", "A_B": "100000000002"}
+
+
+@pytest.fixture
+def period(tmp_path):
+    pd.DataFrame({"UNIT": list(UNITS), "UAN": list(UNITS.values())}).to_excel(tmp_path / "master.xlsx", index=False)
+    (tmp_path / "PF").mkdir()
+    doc = fitz.open()
+    doc.new_page().insert_text((60, 120), "Statement for Jan 2025")
+    for uan in UNITS.values():
+        doc.new_page().insert_text((60, 120), f"1 {uan} NAME 1500.00")
+    doc.new_page().insert_text((60, 120), "Total 3000.00")
+    doc.save(tmp_path / "PF" / "jan.pdf")
+    doc.close()
+    return tmp_path
+
+
+def _poll(root, page_mode=PAGES_RELEVANT):
+    watcher = FolderWatcher(str(root), page_mode=page_mode)
+    watcher.mark_stable()
+    return watcher, watcher.poll()
+
+
+def test_units_with_similar_names_keep_their_own_pages(period):
+    watcher, processed = _poll(period)
+    assert processed == 1
+    [zip_path] = watcher.assemble("jan-2025.zip")
+    with zipfile.ZipFile(zip_path) as archive:
+        for unit, uan in UNITS.items():
+            with zipfile.ZipFile(io.BytesIO(archive.read(f"{unit}_Processed.zip"))) as unit_zip:
+                with fitz.open(stream=unit_zip.read(f"{unit}_Processed.pdf"), filetype="pdf") as doc:
+                    text = "".join(page.get_text() for page in doc)
+            assert [other in text for other in UNITS.values()] == [other == uan for other in UNITS.values()]
+
+
+def test_processed_pdfs_are_skipped_after_a_restart(period, monkeypatch):
+    _poll(period)
+
+    calls = []
+    monkeypatch.setattr(FolderWatcher, "process_pdf", lambda self, name, master, path: calls.append(path))
+    _, processed = _poll(period)
+    assert processed == 0 and calls == []
+
+
+def test_partials_are_rendered_for_matched_units_only(period):
+    doc = fitz.open()
+    doc.new_page().insert_text((60, 120), f"1 {UNITS['A/B']} NAME 900.00")
+    doc.save(period / "PF" / "late.pdf")
+    doc.close()
+
+    watcher, processed = _poll(period, PAGES_ALL)
+    assert processed == 2
+    late_dirs = [
+        path for path in (period / ".watch_state").rglob("partials/*")
+        if (path / _partial_name("A/B")).exists() and not (path / _partial_name("A_B")).exists()
+    ]
+    assert len(late_dirs) == 1  # late.pdf: nothing rendered for A_B, which it does not match
+
+    # At month close, A_B still gets every page of late.pdf (--pages all).
+    [zip_path] = watcher.assemble("jan-2025.zip")
+    with zipfile.ZipFile(zip_path) as archive:
+        with zipfile.ZipFile(io.BytesIO(archive.read("A_B_Processed.zip"))) as unit_zip:
+            with fitz.open(stream=unit_zip.read("A_B_Processed.pdf"), filetype="pdf") as pdf:
+                assert pdf.page_count == 5
+                assert "900.00" in pdf[-1].get_text()
+    assert (late_dirs[0] / _partial_name("A_B")).exists()
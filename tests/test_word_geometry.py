@@ -0,0 +1,82 @@
+"""The NumPy page geometry gives the same rows, bands and boxes as the per-word loop it replaced."""
+import random
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+import word_geometry
+from word_geometry import PageWords, as_tuples, band_mask, candidate_mask, offset_rects, row_rects
+
+TOLERANCE = 3
+OFFSETS = (-1, -2, 1, 2)
+
+
+def _row_rect(token, words, tolerance):
+    """The per-word version: union of the token and every word whose top edge is near it."""
+    row_words = [token] + [w for w in words if abs(w[1] - token[1]) < tolerance]
+    return (
+        min(rw[0] for rw in row_words),
+        min(rw[1] for rw in row_words),
+        max(rw[2] for rw in row_words),
+        max(rw[3] for rw in row_words),
+    )
+
+
+@pytest.fixture(scope="module")
+def words():
+    """Words of a generated statement page: ragged rows, some rows a little off the line."""
+    rng = random.Random(7)
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 40
+    while y < page.rect.height - 20:
+        x = 30 + rng.randint(0, 20)
+        for _ in range(rng.randint(1, 8)):
+            text = rng.choice(["NAME", "1500.00", str(rng.randint(10 ** 9, 10 ** 10)), "A/C", "TOTAL"])
+            page.insert_text((x, y + rng.choice([0, 0, 1.5, -1])), text, fontsize=rng.choice([8, 9, 10]))
+            x += 12 + 7 * len(text)
+        y += rng.choice([9, 12, 14])
+    words = page.get_text("words")
+    doc.close()
+    return words
+
+
+@pytest.mark.parametrize("chunk", [word_geometry.ROW_CHUNK, 7])
+def test_row_rects_match_the_per_word_loop(words, chunk, monkeypatch):
+    monkeypatch.setattr(word_geometry, "ROW_CHUNK", chunk)
+    tokens = words[::3]
+    rows = row_rects(PageWords(tokens).coords, PageWords(words).coords, TOLERANCE)
+    assert len(tokens) > 7 and len(rows) == len(tokens)
+    expected = [_row_rect(token, words, TOLERANCE) for token in tokens]
+    assert as_tuples(rows) == [tuple(float(v) for v in rect) for rect in expected]
+    assert any(rect != tuple(token[:4]) for rect, token in zip(expected, tokens))  # rows span several words
+
+
+def test_band_mask_matches_the_per_word_loop(words):
+    rows = row_rects(PageWords(words).coords, PageWords(words).coords, TOLERANCE)
+    for header_limit, footer_limit in [(None, None), (120, None), (None, 700), (120, 700)]:
+        expected = [
+            not (header_limit is not None and row[1] < header_limit)
+            and not (footer_limit is not None and row[3] > footer_limit)
+            for row in as_tuples(rows)
+        ]
+        assert band_mask(rows, header_limit, footer_limit).tolist() == expected
+
+
+def test_offset_rects_and_candidates_match_the_per_word_loop(words):
+    tokens = PageWords(words)
+    is_id = candidate_mask(tokens.texts, lambda text: text.isdigit() and len(text) == 10)
+    assert is_id.tolist() == [w[4].isdigit() and len(w[4]) == 10 for w in words]
+
+    dx0, dy0, dx1, dy1 = OFFSETS
+    expected = [(w[0] + dx0, w[1] + dy0, w[2] + dx1, w[3] + dy1) for w in words if w[4].isdigit() and len(w[4]) == 10]
+    assert as_tuples(offset_rects(tokens.coords[is_id], OFFSETS)) == expected
+
+
+def test_empty_page():
+    empty = PageWords([])
+    assert empty.coords.shape == (0, 4)
+    assert row_rects(empty.coords, empty.coords, TOLERANCE).shape == (0, 4)
+    assert not band_mask(empty.coords, 10, 20).any()
+    assert np.array_equal(candidate_mask(empty.texts, bool), np.array([], dtype=bool))
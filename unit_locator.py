@@ -0,0 +1,130 @@
+"""
+Single-pass unit name locator.
+
+The sections used to call `page.search_for(unit)` for every unit on every emitted page,
+which is one full-page text search per unit. Here the page words are joined once into a
+searchable text index and scanned with an Aho-Corasick automaton built over all unit
+names, so every unit present on the page is found in one pass over the page text.
+
+Matching follows `search_for`: case-insensitive, whitespace between words is treated as
+a single space, and a hit that spans several lines yields one rectangle per line.
+"""
+from collections import deque
+
+import fitz  # PyMuPDF
+
+
+def _normalize(text):
+    return " ".join(str(text).split()).lower()
+
+
+class UnitMatcher:
+    """
+    Aho-Corasick automaton over all unit names.
+    Build it once per run and reuse it for every page of every PDF.
+    """
+
+    def __init__(self, units):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for unit in units:
+            key = _normalize(unit)
+            if not key:
+                continue
+            node = 0
+            for ch in key:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = nxt
+            self.output[node].append((unit, len(key)))
+
+        # Breadth-first pass to build the failure links.
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yields (unit, start, end) for every occurrence of every unit name in text."""
+        node = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for unit, length in output[node]:
+                yield unit, i - length + 1, i + 1
+
+
+def build_page_index(words):
+    """
+    Joins the page words (as returned by `page.get_text("words")`) into one lower-cased
+    text, and records for every word the character span it occupies in that text.
+    """
+    parts = []
+    spans = []
+    pos = 0
+    for w in words:
+        token = _normalize(w[4])
+        if not token:
+            spans.append((pos, pos))
+            continue
+        if parts:
+            parts.append(" ")
+            pos += 1
+        parts.append(token)
+        spans.append((pos, pos + len(token)))
+        pos += len(token)
+    return "".join(parts), spans
+
+
+def locate_units(words, matcher):
+    """
+    Returns {unit: [fitz.Rect, ...]} for every unit name found on the page.
+    Units that do not occur on the page are absent from the result.
+    """
+    if not words or not matcher.goto[0]:
+        return {}
+
+    text, spans = build_page_index(words)
+    # Map every character position back to the word that owns it.
+    owner = [-1] * len(text)
+    for idx, (s, e) in enumerate(spans):
+        for p in range(s, e):
+            owner[p] = idx
+
+    found = {}
+    for unit, start, end in matcher.iter_matches(text):
+        # Group the covered words by text line, one rectangle per line like search_for.
+        lines = {}
+        for idx in sorted({owner[p] for p in range(start, end) if owner[p] >= 0}):
+            w = words[idx]
+            s, e = spans[idx]
+            length = e - s
+            # Trim partially covered words proportionally to the covered characters.
+            x0, x1 = w[0], w[2]
+            if start > s:
+                x0 = w[0] + (w[2] - w[0]) * (start - s) / length
+            if end < e:
+                x1 = w[0] + (w[2] - w[0]) * (end - s) / length
+            rect = fitz.Rect(x0, w[1], x1, w[3])
+            key = (w[5], w[6]) if len(w) > 6 else idx
+            if key in lines:
+                lines[key] |= rect
+            else:
+                lines[key] = rect
+        found.setdefault(unit, []).extend(lines.values())
+    return found
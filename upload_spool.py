@@ -0,0 +1,67 @@
+"""
+Spools uploaded PDFs to a temporary directory once per run.
+
+Reading an upload with `read()` / `getvalue()` copies it into a Python bytes object,
+and `fitz.open(stream=...)` then copies it again into MuPDF's buffer; a `read()` upload
+also cannot be read a second time. Instead each upload's buffer is written to disk once
+(straight from its memoryview, no intermediate copy) and every consumer - worker
+thread or process - opens the file by path, letting MuPDF read pages from disk on
+demand.
+"""
+import os
+import re
+import shutil
+import tempfile
+
+_UNSAFE_CHARS = re.compile(r"[^\w.\- ]")
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _safe_name(name):
+    return _UNSAFE_CHARS.sub("_", os.path.basename(name or "upload.pdf"))
+
+
+class UploadSpool:
+    """
+    Temporary directory of spooled uploads. `add(upload)` returns the file path; the
+    same upload is only written once. Call `cleanup()` (or use it as a context manager)
+    once every document opened from it is closed.
+    """
+
+    def __init__(self, prefix="core_integra_"):
+        self._dir = tempfile.TemporaryDirectory(prefix=prefix, ignore_cleanup_errors=True)
+        self.paths = {}
+
+    @property
+    def directory(self):
+        return self._dir.name
+
+    def add(self, upload):
+        # Already on disk: use it in place.
+        if isinstance(upload, (str, os.PathLike)):
+            return os.fspath(upload)
+
+        key = getattr(upload, "file_id", None) or id(upload)
+        if key in self.paths:
+            return self.paths[key]
+
+        path = os.path.join(self._dir.name, f"{len(self.paths):04d}_{_safe_name(getattr(upload, 'name', None))}")
+        with open(path, "wb") as f:
+            if hasattr(upload, "getbuffer"):
+                with upload.getbuffer() as view:
+                    f.write(view)
+            else:
+                upload.seek(0)
+                shutil.copyfileobj(upload, f, _CHUNK_SIZE)
+        self.paths[key] = path
+        return path
+
+    def cleanup(self):
+        self.paths.clear()
+        self._dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
@@ -0,0 +1,280 @@
+"""
+Watch-folder daemon: processes statement PDFs as they arrive during the month.
+
+Layout of a period folder (one per month):
+
+  <root>/master.xlsx   the unit master (UNIT plus UAN / ESINO / BANK_ACC_NO columns)
+  <root>/PF/*.pdf      statements of each type, dropped in whenever they arrive
+  <root>/ESIC/*.pdf
+  <root>/BANK/*.pdf
+
+Every poll, each new PDF whose size has stopped changing is routed against the current
+master (checkpointed, see run_checkpoint.py) and the annotated pages of that PDF are
+rendered straight away into per-unit partial PDFs inside the run workspace, for the
+units with a match in it. If the master changes, the workspace changes with it and the
+PDFs are processed again.
+
+At month close, `--assemble` only resumes the checkpointed routing, concatenates each
+unit's partial PDFs and writes the usual per-type ZIP of unit ZIPs to <root>/output.
+A unit also gets pages of PDFs it has no match in (every page with --pages all, the
+always-kept pages otherwise); those partials are only rendered here, for the units that
+are output, and kept for the next assembly.
+
+The workspaces live in <root>/.watch_state (or --state-dir), outside the shared
+checkpoint directory, so they are never pruned during the month. PDFs already processed
+are recorded by size and modification time in each workspace (processed.json) and
+skipped without being read again, also after the daemon restarts.
+
+  python watch_folder.py --root "D:/statements/2025-01"                 run the daemon
+  python watch_folder.py --root ... --once                              one pass and exit
+  python watch_folder.py --root ... --assemble --zip-name jan-2025.zip  month close
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+
+import fitz  # PyMuPDF
+
+import ops_metrics
+from run_checkpoint import RunCheckpoint
+from statement_engine import (
+    MODE_HIGHLIGHT, MODE_MASK, PAGES_ALL, PAGES_RELEVANT, StatementRun, build_unit_zip, load_masters,
+)
+from statement_profiles import get_profile
+
+STATEMENT_TYPES = ("PF", "ESIC", "BANK")
+POLL_INTERVAL = 30  # seconds
+STATE_DIRNAME = ".watch_state"
+PROCESSED_FILE = "processed.json"
+
+log = logging.getLogger("watch_folder")
+
+
+def _partial_name(unit):
+    """File name of a unit's partial PDF; a hash, so distinct units never share a file."""
+    return hashlib.sha256(str(unit).encode("utf-8")).hexdigest()[:24] + ".pdf"
+
+
+class FolderWatcher:
+    def __init__(self, root, master_path=None, mode=MODE_HIGHLIGHT, page_mode=PAGES_ALL, state_dir=None):
+        self.root = root
+        self.master_path = master_path or os.path.join(root, "master.xlsx")
+        self.state_dir = state_dir or os.path.join(root, STATE_DIRNAME)
+        self.mode = mode
+        self.page_mode = page_mode
+        self._masters = {}
+        self._checkpoints = {}
+        self._master_stamp = None
+        self._stamps = {}  # path -> (size, mtime) at the previous poll
+        self._processed = {}  # statement type -> {file name: (size, mtime)} processed with the current master
+
+    def statement_types(self):
+        return [name for name in STATEMENT_TYPES if os.path.isdir(os.path.join(self.root, name))]
+
+    def masters(self):
+        """{statement type: MasterData}, reloaded whenever the master file changes."""
+        stat = os.stat(self.master_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._master_stamp:
+            profiles = [get_profile(name) for name in self.statement_types()]
+            self._masters = load_masters(self.master_path, profiles)
+            self._checkpoints = {
+                name: RunCheckpoint(master, self.mode, self.page_mode, root=self.state_dir, max_age=None)
+                for name, master in self._masters.items()
+            }
+            self._master_stamp = stamp
+            self._processed = {name: self._load_processed(name) for name in self._checkpoints}
+            log.info("Loaded master %s for %s", self.master_path, ", ".join(self._masters))
+        return self._masters
+
+    def _processed_path(self, name):
+        return os.path.join(self._checkpoints[name].directory, PROCESSED_FILE)
+
+    def _load_processed(self, name):
+        try:
+            with open(self._processed_path(name), encoding="utf-8") as f:
+                return {entry: tuple(stamp) for entry, stamp in json.load(f).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+
+    def _save_processed(self, name):
+        path = self._processed_path(name)
+        tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._processed[name], f)
+        os.replace(tmp_path, path)
+
+    def _partial_dir(self, checkpoint, digest):
+        return os.path.join(checkpoint.directory, "partials", digest)
+
+    def pdfs(self, name):
+        folder = os.path.join(self.root, name)
+        return sorted(
+            os.path.join(folder, entry) for entry in os.listdir(folder) if entry.lower().endswith(".pdf")
+        )
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def mark_stable(self):
+        """Treats every PDF present now as completely copied (no previous poll to compare)."""
+        for name in self.statement_types():
+            for path in self.pdfs(name):
+                self._stamps[path] = self._stamp(path)
+
+    def _is_stable(self, path):
+        """True once a file has the same size and mtime on two consecutive polls (copy finished)."""
+        stamp = self._stamp(path)
+        previous = self._stamps.get(path)
+        self._stamps[path] = stamp
+        return previous == stamp
+
+    def process_pdf(self, name, master, path):
+        """Routes one PDF and renders its per-unit partial PDFs into the workspace."""
+        run = StatementRun(master, self.mode, self._checkpoints[name])
+        try:
+            source = run.add_upload(path)
+            partial_dir = self._partial_dir(run.checkpoint, run.source_digest(source))
+            if os.path.exists(os.path.join(partial_dir, "done")):
+                return False
+            with run.processing():
+                run.add_result(source, run.route(source, self.page_mode))
+            os.makedirs(partial_dir, exist_ok=True)
+            for unit in run.output_units():
+                _write_partial(os.path.join(partial_dir, _partial_name(unit)), run.render_unit_pdf(unit))
+            open(os.path.join(partial_dir, "done"), "w").close()
+            log.info("%s: processed %s (%d pages)", name, os.path.basename(path), run.page_count)
+            return True
+        finally:
+            run.close()
+
+    def poll(self):
+        """One pass over the input folders; returns the number of PDFs processed."""
+        processed = 0
+        masters = self.masters()
+        for name, master in masters.items():
+            done = self._processed[name]
+            for path in self.pdfs(name):
+                entry = os.path.basename(path)
+                if not self._is_stable(path) or done.get(entry) == self._stamps[path]:
+                    continue
+                try:
+                    processed += self.process_pdf(name, master, path)
+                    done[entry] = self._stamps[path]
+                    self._save_processed(name)
+                except Exception:
+                    log.exception("%s: failed to process %s", name, path)
+        return processed
+
+    def run_forever(self, interval=POLL_INTERVAL):
+        log.info("Watching %s every %ss", self.root, interval)
+        while True:
+            try:
+                self.poll()
+            except FileNotFoundError as e:
+                log.warning("Waiting for input: %s", e)
+            time.sleep(interval)
+
+    def assemble(self, zip_name):
+        """
+        Month close: merges the partial PDFs of every processed statement into each
+        unit's final PDF and writes <root>/output/<TYPE>-<zip_name>. PDFs that were not
+        processed yet (e.g. dropped in just now) are processed first.
+        """
+        output_dir = os.path.join(self.root, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        self.mark_stable()
+        self.poll()
+
+        written = []
+        for name, master in self.masters().items():
+            run = StatementRun(master, self.mode, self._checkpoints[name])
+            try:
+                partial_dirs = {}
+                for path in self.pdfs(name):
+                    source = run.add_upload(path)
+                    result = run.resume(source)
+                    if result is None:
+                        log.warning("%s: %s was not processed, skipped", name, path)
+                        continue
+                    run.add_result(source, result)
+                    partial_dirs[source] = self._partial_dir(run.checkpoint, run.source_digest(source))
+
+                units = run.output_units()
+                if not units:
+                    log.info("%s: no unit matched, nothing to assemble", name)
+                    continue
+                zip_path = os.path.join(output_dir, f"{name}-{zip_name}")
+                with ops_metrics.timed("assemble", name), zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for unit in units:
+                        paths = []
+                        for source in sorted({source for source, _ in run.unit_pages[unit]}):
+                            path = os.path.join(partial_dirs[source], _partial_name(unit))
+                            if not os.path.exists(path):  # no match in that PDF
+                                _write_partial(path, run.render_unit_pdf(unit, only_source=source))
+                            paths.append(path)
+                        pdf_bytes = merge_partials(paths)
+                        unit_zip = build_unit_zip(master, unit, pdf_bytes, run.matched[unit])
+                        archive.writestr(run.unit_zip_name(unit), unit_zip)
+                ops_metrics.OUTPUT_BYTES.inc(os.path.getsize(zip_path), section=name, kind="master_zip")
+                log.info("%s: wrote %s (%d units)", name, zip_path, len(units))
+                written.append(zip_path)
+            finally:
+                run.close()
+        return written
+
+
+def _write_partial(path, pdf_bytes):
+    tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+
+
+def merge_partials(paths):
+    """Concatenates already annotated partial PDFs (annotations are copied as they are)."""
+    out = fitz.open()
+    try:
+        for path in paths:
+            with fitz.open(path) as part:
+                out.insert_pdf(part)
+        return out.tobytes()
+    finally:
+        out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process statement PDFs as they arrive in a period folder")
+    parser.add_argument("--root", required=True, help="period folder with master.xlsx and PF/ESIC/BANK subfolders")
+    parser.add_argument("--master", help="master Excel file (default: <root>/master.xlsx)")
+    parser.add_argument("--state-dir", help=f"workspaces of the month (default: <root>/{STATE_DIRNAME})")
+    parser.add_argument("--mode", choices=[MODE_HIGHLIGHT, MODE_MASK], default=MODE_HIGHLIGHT)
+    parser.add_argument("--pages", choices=[PAGES_ALL, PAGES_RELEVANT], default=PAGES_ALL)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    parser.add_argument("--assemble", action="store_true", help="month close: build the final ZIPs")
+    parser.add_argument("--zip-name", default="output.zip", help="final ZIP name, e.g. jan-2025.zip")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ops_metrics.start_exporters()
+    watcher = FolderWatcher(args.root, args.master, args.mode, args.pages, args.state_dir)
+    if args.assemble:
+        for path in watcher.assemble(args.zip_name):
+            print(path)
+    elif args.once:
+        watcher.mark_stable()
+        watcher.poll()
+    else:
+        watcher.run_forever(args.interval)
+
+
+if __name__ == "__main__":
+    main()
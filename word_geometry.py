@@ -0,0 +1,78 @@
+"""
+Batched geometry over the words of one page.
+
+A page's words (and the merged digit-group tokens, see id_index.candidate_tokens) are
+converted once into an (n, 4) coordinate array plus a token array. ID candidate
+filtering, highlight rectangle offsets, row boxes and header/footer band tests then
+run as array operations per page instead of word by word in Python.
+"""
+import numpy as np
+
+# Tokens per block when comparing every token against every word of the page
+# (keeps the tokens x words matrices small on very dense pages).
+ROW_CHUNK = 512
+
+
+class PageWords:
+    """Coordinates (float64, shape (n, 4)) and texts (object array) of a word list."""
+
+    def __init__(self, words):
+        self.words = words
+        self.coords = np.array([w[:4] for w in words], dtype=float).reshape(-1, 4)
+        self.texts = np.array([w[4] for w in words], dtype=object)
+
+    def __len__(self):
+        return len(self.words)
+
+
+def candidate_mask(texts, is_candidate):
+    """
+    Boolean mask of the tokens for which is_candidate(text) holds. The test runs once per
+    distinct text; page numbers, amounts and names repeat a lot on statement pages.
+    """
+    seen = {}
+    return np.fromiter(
+        (seen[text] if text in seen else seen.setdefault(text, is_candidate(text)) for text in texts),
+        dtype=bool,
+        count=len(texts),
+    )
+
+
+def offset_rects(coords, offsets):
+    """Every box grown by (dx0, dy0, dx1, dy1)."""
+    return coords + np.asarray(offsets, dtype=float)
+
+
+def row_rects(token_coords, word_coords, tolerance):
+    """
+    For every token, the union of its box and the boxes of all words whose top edge is
+    within `tolerance` of the token's top edge (the token's statement row).
+    """
+    rows = token_coords.copy()
+    if not len(word_coords):
+        return rows
+    for start in range(0, len(token_coords), ROW_CHUNK):
+        block = token_coords[start:start + ROW_CHUNK]
+        near = np.abs(block[:, None, 1] - word_coords[None, :, 1]) < tolerance
+        rows[start:start + ROW_CHUNK] = np.column_stack([
+            np.minimum(block[:, 0], np.where(near, word_coords[:, 0], np.inf).min(axis=1)),
+            np.minimum(block[:, 1], np.where(near, word_coords[:, 1], np.inf).min(axis=1)),
+            np.maximum(block[:, 2], np.where(near, word_coords[:, 2], -np.inf).max(axis=1)),
+            np.maximum(block[:, 3], np.where(near, word_coords[:, 3], -np.inf).max(axis=1)),
+        ])
+    return rows
+
+
+def band_mask(rects, header_limit, footer_limit):
+    """True for boxes that start below the header band and end above the footer band."""
+    keep = np.ones(len(rects), dtype=bool)
+    if header_limit is not None:
+        keep &= rects[:, 1] >= header_limit
+    if footer_limit is not None:
+        keep &= rects[:, 3] <= footer_limit
+    return keep
+
+
+def as_tuples(rects):
+    """Array rows as plain float tuples (hashable, as the annotation stage expects)."""
+    return [tuple(rect) for rect in rects.tolist()]